@@ -113,22 +113,101 @@ exports.listFiles = async (req, res) => {
 };
 
 /**
- * Download a result file
+ * Proxy a GET on one scoring run's stored predictions (query, hosts, services),
+ * passing the query string through
  */
+async function proxyPredictionsView(req, res, view) {
+  try {
+    const { filename } = req.params;
+    const query = new URLSearchParams(req.query).toString();
+    const result = await proxyToMLAPI(
+      `/api/analysis/predictions/${encodeURIComponent(filename)}/${view}${query ? `?${query}` : ''}`,
+      'GET'
+    );
+    res.status(result.status).json(result.data);
+  } catch (error) {
+    res.status(500).json({ 
+      success: false,
+      error: error.message 
+    });
+  }
+}
+
+/**
+ * Query stored predictions (filters and pagination run in the ML API)
+ */
+exports.queryPredictions = (req, res) => proxyPredictionsView(req, res, 'query');
+
+/**
+ * Per-host / per-service rollups and single-host drill-down
+ */
+exports.predictionHosts = (req, res) => proxyPredictionsView(req, res, 'hosts');
+exports.predictionHostDetail = (req, res) =>
+  proxyPredictionsView(req, res, `hosts/${encodeURIComponent(req.params.host)}`);
+exports.predictionServices = (req, res) => proxyPredictionsView(req, res, 'services');
+
+/**
+ * Time-bucketed alert counts (trend charts) from the ML API's precomputed rollups
+ */
+exports.alertRollups = async (req, res) => {
+  try {
+    const query = new URLSearchParams(req.query).toString();
+    const result = await proxyToMLAPI(`/api/analysis/alert-rollups${query ? `?${query}` : ''}`, 'GET');
+    res.status(result.status).json(result.data);
+  } catch (error) {
+    res.status(500).json({ 
+      success: false,
+      error: error.message 
+    });
+  }
+};
+
+/**
+ * Download a result file.
+ * Streams the ML API response through without buffering, forwarding the
+ * conditional/range/encoding headers both ways so compression, resumable
+ * Range pulls and 304 revalidation work end to end.
+ */
+const DOWNLOAD_REQUEST_HEADERS = ['range', 'if-range', 'if-none-match', 'if-modified-since', 'accept-encoding'];
+const DOWNLOAD_RESPONSE_HEADERS = [
+  'content-type', 'content-length', 'content-encoding', 'content-range', 'content-disposition',
+  'accept-ranges', 'etag', 'last-modified', 'cache-control', 'vary',
+];
+
 exports.downloadFile = async (req, res) => {
   try {
     const { filename } = req.params;
-    const url = `${ML_API_URL}/api/analysis/download/${filename}`;
-    const response = await fetch(url);
-    
-    if (!response.ok) {
-      return res.status(response.status).json({ error: 'File not found' });
+    const url = `${ML_API_URL}/api/analysis/download/${encodeURIComponent(filename)}`;
+    const headers = {};
+    for (const name of DOWNLOAD_REQUEST_HEADERS) {
+      if (req.headers[name]) headers[name] = req.headers[name];
     }
-    
-    const buffer = await response.buffer();
-    res.setHeader('Content-Type', 'application/octet-stream');
-    res.setHeader('Content-Disposition', `attachment; filename="${filename}"`);
-    res.send(buffer);
+    // compress: false keeps node-fetch from decoding gzip so the encoded body passes through
+    const response = await fetch(url, { headers, compress: false });
+
+    if (response.status === 404) {
+      return res.status(404).json({ error: 'File not found' });
+    }
+    if (!response.ok && response.status !== 304) {
+      return res.status(response.status).json({ error: `Download failed: ${response.statusText}` });
+    }
+
+    res.status(response.status);
+    for (const name of DOWNLOAD_RESPONSE_HEADERS) {
+      const value = response.headers.get(name);
+      if (value) res.setHeader(name, value);
+    }
+    if (!response.headers.get('content-disposition')) {
+      res.setHeader('Content-Disposition', `attachment; filename="${filename}"`);
+    }
+    if (response.status === 304) {
+      return res.end();
+    }
+    response.body.on('error', (err) => res.destroy(err));
+    res.on('close', () => {
+      if (!res.writableFinished) response.body.destroy();
+    });
+    response.body.pipe(res);
   } catch (error) {
     res.status(500).json({ 
       success: false,
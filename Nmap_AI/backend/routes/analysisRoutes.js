@@ -8,6 +8,11 @@ router.post('/stop-tcpdump', analysisController.stopTcpdump);
 router.post('/score', analysisController.scorePcap);
 router.post('/predict', analysisController.predict);
 router.get('/files', analysisController.listFiles);
+router.get('/predictions/:filename/query', analysisController.queryPredictions);
+router.get('/predictions/:filename/hosts', analysisController.predictionHosts);
+router.get('/predictions/:filename/hosts/:host', analysisController.predictionHostDetail);
+router.get('/predictions/:filename/services', analysisController.predictionServices);
+router.get('/alert-rollups', analysisController.alertRollups);
 router.get('/download/:filename', analysisController.downloadFile);
 
 module.exports = router;
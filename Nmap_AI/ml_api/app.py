@@ -5,15 +5,26 @@ import json
 import subprocess
 import gzip
 from pathlib import Path
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file
 from flask_cors import CORS
 import joblib
 import pandas as pd
 import numpy as np
 import shutil
 import stat
+import threading
+import zlib
+from functools import wraps
 from shutil import which
 
+try:
+    import zstandard
+except ImportError:  # optional: zstd content-encoding is offered only when installed
+    zstandard = None
+
+from prediction_store import (QUERY_DEFAULT_LIMIT, query_prediction_store, query_rollup, query_time_rollups,
+                              store_path_for)
+
 app = Flask(__name__)
 CORS(app)
 
@@ -21,12 +32,21 @@ CORS(app)
 BASE_DIR = Path(__file__).parent.resolve()
 PCAP_DIR = (BASE_DIR / 'pcaps')
 RESULTS_DIR = (BASE_DIR / 'results')
+CACHE_DIR = (BASE_DIR / 'cache')
+VERDICT_CACHE_PATH = CACHE_DIR / 'verdict_cache.joblib'
+# append-only per-second/per-minute alert counts, merged across predict runs
+TIME_ROLLUPS_DIR = RESULTS_DIR / 'rollups'
+# CIDR lists (allow*.txt / block*.txt, one address or CIDR per line, optional label)
+REPUTATION_DIR = BASE_DIR / 'reputation'
+REPUTATION_CACHE_PATH = CACHE_DIR / 'reputation_index.joblib'
+ALLOWLIST_SKIP_INFERENCE = True   # allowlisted flows bypass the model unless a request says otherwise
 # prefer a saved joblib model in the parent project root (adjust via env if needed)
 MODEL_PATH = BASE_DIR / 'network_anomaly_detection_model.joblib'
 
 # Ensure directories exist (create parents, use absolute paths)
 PCAP_DIR.mkdir(parents=True, exist_ok=True)
 RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+CACHE_DIR.mkdir(parents=True, exist_ok=True)
 for d in [PCAP_DIR, RESULTS_DIR]:
     d.mkdir(parents=True, exist_ok=True)
     if os.name != 'nt':  # For Linux/WSL
@@ -35,11 +55,124 @@ for d in [PCAP_DIR, RESULTS_DIR]:
 
 print(f"Directories initialized:\nPCAPs: {PCAP_DIR}\nResults: {RESULTS_DIR}")
 
+# ---------- DOWNLOADS ----------
+DOWNLOAD_CHUNK_BYTES = 256 * 1024
+COMPRESS_MIN_BYTES = 1024
+# already compressed: served as-is, never re-encoded
+INCOMPRESSIBLE_SUFFIXES = {'.gz', '.zst', '.zip', '.bz2', '.xz', '.png', '.jpg', '.pdf'}
+# ----------------------------
+
+# ---------- METRICS ----------
+# Minimal in-process Prometheus-style registry, rendered by GET /metrics.
+# Keys are (metric_name, sorted label tuple).
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+ROWS_PER_SECOND_BUCKETS = (100, 1000, 10000, 50000, 100000, 500000, 1000000, 5000000)
+METRIC_HELP = {
+    'ml_api_zeek_conversion_seconds': ('histogram', 'Wall time of the Zeek PCAP to conn.log conversion'),
+    'ml_api_scorer_stage_seconds': ('histogram', 'Wall time of each scorer.py stage (parse, featurize, align, predict, write, ...)'),
+    'ml_api_scorer_run_seconds': ('histogram', 'Wall time of a full scorer.py subprocess run'),
+    'ml_api_rows_scored_per_second': ('histogram', 'Model inference throughput reported by scorer.py'),
+    'ml_api_request_seconds': ('histogram', 'Request handling time per endpoint'),
+    'ml_api_rows_scored_total': ('counter', 'Total conn records scored'),
+    'ml_api_requests_total': ('counter', 'Requests handled per endpoint and outcome'),
+    'ml_api_inflight_requests': ('gauge', 'Requests currently being processed per endpoint (queue depth)'),
+    'ml_api_model_load_seconds': ('gauge', 'Time taken by the last in-process model load'),
+}
+_metrics_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_gauges = {}
+
+def _metric_key(name, labels):
+    return (name, tuple(sorted((labels or {}).items())))
+
+def observe_metric(name, value, labels=None, buckets=METRIC_BUCKETS):
+    """Record one observation in a histogram"""
+    key = _metric_key(name, labels)
+    with _metrics_lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = {'buckets': buckets, 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+        for i, le in enumerate(h['buckets']):
+            if value <= le:
+                h['counts'][i] += 1
+        h['sum'] += float(value)
+        h['count'] += 1
+
+def inc_metric(name, amount=1, labels=None):
+    """Increment a counter"""
+    key = _metric_key(name, labels)
+    with _metrics_lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def set_metric(name, value, labels=None):
+    """Set a gauge to an absolute value"""
+    with _metrics_lock:
+        _gauges[_metric_key(name, labels)] = value
+
+def add_metric(name, amount, labels=None):
+    """Add to (or subtract from) a gauge"""
+    key = _metric_key(name, labels)
+    with _metrics_lock:
+        _gauges[key] = _gauges.get(key, 0) + amount
+
+def _format_labels(label_items, extra=None):
+    items = list(label_items) + list(extra or [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in items) + '}'
+
+def render_metrics():
+    """Render all metrics in the Prometheus text exposition format"""
+    lines = []
+    with _metrics_lock:
+        by_name = {}
+        for store in (_histograms, _counters, _gauges):
+            for (name, labels), value in store.items():
+                by_name.setdefault(name, []).append((labels, value))
+        for name in sorted(by_name):
+            kind, help_text = METRIC_HELP.get(name, ('untyped', name))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(by_name[name], key=lambda x: x[0]):
+                if kind == 'histogram':
+                    for le, c in zip(value['buckets'], value['counts']):
+                        lines.append(f'{name}_bucket{_format_labels(labels, [("le", le)])} {c}')
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {value["count"]}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {value["sum"]}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {value["count"]}')
+                else:
+                    lines.append(f'{name}{_format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+def track_request(endpoint):
+    """Decorator: keeps the in-flight gauge and per-endpoint latency/outcome metrics up to date"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            labels = {'endpoint': endpoint}
+            add_metric('ml_api_inflight_requests', 1, labels)
+            t0 = time.perf_counter()
+            status = 500
+            try:
+                resp = fn(*args, **kwargs)
+                status = resp[1] if isinstance(resp, tuple) else getattr(resp, 'status_code', 200)
+                return resp
+            finally:
+                add_metric('ml_api_inflight_requests', -1, labels)
+                observe_metric('ml_api_request_seconds', time.perf_counter() - t0, labels)
+                inc_metric('ml_api_requests_total', 1, {'endpoint': endpoint, 'status': str(status)})
+        return wrapper
+    return decorator
+# ----------------------------
+
 # Load model once at startup (safe load)
 model = None
 try:
     if MODEL_PATH.exists():
+        t0 = time.perf_counter()
         model = joblib.load(MODEL_PATH)
+        set_metric('ml_api_model_load_seconds', time.perf_counter() - t0)
         print(f"✅ Model loaded successfully from {MODEL_PATH}")
     else:
         print(f"⚠️ Model path does not exist: {MODEL_PATH}")
@@ -59,6 +192,11 @@ def health():
         'timestamp': time.time()
     })
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/analysis/start-tcpdump', methods=['POST'])
 def start_tcpdump():
     """Start tcpdump to capture network traffic"""
@@ -139,6 +277,7 @@ def stop_tcpdump():
         }), 500
 
 @app.route('/api/analysis/score', methods=['POST'])
+@track_request('score')
 def score_pcap():
     """Convert PCAP to Zeek logs"""
     try:
@@ -172,6 +311,7 @@ def score_pcap():
 
         print(f"Running Zeek:\nCommand: {' '.join(zeek_cmd)}\nPCAP: {candidate}\nOutput dir: {output_dir}")
 
+        t0 = time.perf_counter()
         result = subprocess.run(
             zeek_cmd,
             capture_output=True,
@@ -179,6 +319,7 @@ def score_pcap():
             cwd=str(output_dir),
             check=False  # capture failure and show stdout/stderr
         )
+        observe_metric('ml_api_zeek_conversion_seconds', time.perf_counter() - t0)
 
         # Debug info
         print("Zeek returncode:", result.returncode)
@@ -243,7 +384,25 @@ def score_pcap():
             'traceback': traceback.format_exc()
         }), 500
 
+def _number_arg(source, name, cast, default=None, minimum=None):
+    """
+    Numeric request parameter (query string or JSON body): default when absent,
+    ValueError (answered with 400) when it does not parse or is below minimum.
+    """
+    value = source.get(name)
+    if value is None or value == '':
+        return default
+    kind = 'an integer' if cast is int else 'a number'
+    try:
+        number = cast(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f'{name} must be {kind}') from None
+    if not np.isfinite(number) or (minimum is not None and number < minimum):
+        raise ValueError(f'{name} must be {kind}' + (f' >= {minimum}' if minimum is not None else ''))
+    return number
+
 @app.route('/api/analysis/predict', methods=['POST'])
+@track_request('predict')
 def predict():
     """
     Run scorer.py on a Zeek conn log and (optionally) run the ML model.
@@ -252,6 +411,12 @@ def predict():
     try:
         data = request.json or {}
         conn_log = data.get('conn_log')
+        try:
+            row_budget = _number_arg(data, 'row_budget', int, minimum=0)
+            time_budget = _number_arg(data, 'time_budget', float, minimum=0)
+            max_alerts = _number_arg(data, 'max_alerts', int, 100, minimum=0)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
 
         # Resolve conn_log: provided path or newest in results/ or pcaps/
         candidate = None
@@ -310,6 +475,7 @@ def predict():
         # Prepare scorer command
         timestamp = int(time.time())
         output_csv = RESULTS_DIR / f'predictions_{timestamp}.csv'
+        alerts_jsonl = RESULTS_DIR / f'alerts_{timestamp}.jsonl'
         scorer_py = Path(__file__).parent / 'scorer.py'
         if not scorer_py.exists():
             return jsonify({'success': False, 'error': f'scorer.py not found at {scorer_py}'}), 500
@@ -318,14 +484,40 @@ def predict():
             sys.executable,
             str(scorer_py),
             '--zeek_conn', str(candidate),
-            '--output', str(output_csv)
+            '--output', str(output_csv),
+            '--alerts_output', str(alerts_jsonl)
         ]
-        # include model if present
+        # include model if present (with the cross-request verdict cache)
         if MODEL_PATH and Path(MODEL_PATH).exists():
-            cmd += ['--model', str(MODEL_PATH)]
+            cmd += ['--model', str(MODEL_PATH), '--verdict_cache', str(VERDICT_CACHE_PATH),
+                    '--time_rollups_dir', str(TIME_ROLLUPS_DIR)]
+        # opt-in log2 bucketing of duration/bytes for inference dedup
+        if data.get('quantize'):
+            cmd += ['--quantize']
+        # allow/blocklist enrichment: tag endpoints, optionally skip inference for allowlisted flows
+        allowlists = sorted(REPUTATION_DIR.glob('allow*.txt'))
+        blocklists = sorted(REPUTATION_DIR.glob('block*.txt'))
+        for path in allowlists:
+            cmd += ['--allowlist', str(path)]
+        for path in blocklists:
+            cmd += ['--blocklist', str(path)]
+        if allowlists or blocklists:
+            cmd += ['--reputation_cache', str(REPUTATION_CACHE_PATH)]
+            if data.get('skip_allowlisted', ALLOWLIST_SKIP_INFERENCE):
+                cmd += ['--skip_allowlisted']
+        # load shedding: score priority traffic fully and sample the rest within a row/time budget
+        if row_budget:
+            cmd += ['--row_budget', str(row_budget)]
+        if time_budget:
+            cmd += ['--time_budget', str(time_budget)]
+        # opt-in per-stage cProfile/tracemalloc report (written next to the CSV)
+        if data.get('profile'):
+            cmd += ['--profile']
 
         # Run scorer.py and capture stdout (it returns JSON)
+        t0 = time.perf_counter()
         proc = subprocess.run(cmd, capture_output=True, text=True, check=False)
+        observe_metric('ml_api_scorer_run_seconds', time.perf_counter() - t0)
         stdout = (proc.stdout or '').strip()
         stderr = (proc.stderr or '').strip()
 
@@ -352,8 +544,45 @@ def predict():
         else:
             parsed_meta['scorer_output'] = parsed
 
+        # return the top alerts straight from the (capped) alert stream, not the full predictions CSV
+        if alerts_jsonl.exists():
+            alerts = []
+            with open(alerts_jsonl, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if len(alerts) >= max_alerts:
+                        break
+                    if line.strip():
+                        alerts.append(json.loads(line))
+            parsed_meta['alerts'] = alerts
+            parsed_meta['alerts_file'] = alerts_jsonl.name
+
+        # predictions can be filtered server-side via /api/analysis/predictions/<output_csv>/query
+        if parsed_meta.get('prediction_store'):
+            parsed_meta['query_url'] = f'/api/analysis/predictions/{output_csv.name}/query'
+            parsed_meta['hosts_url'] = f'/api/analysis/predictions/{output_csv.name}/hosts'
+            parsed_meta['services_url'] = f'/api/analysis/predictions/{output_csv.name}/services'
+
+        # expose the profile report as a download name under RESULTS_DIR
+        if parsed_meta.get('profile_report'):
+            parsed_meta['profile_report_file'] = Path(parsed_meta['profile_report']).name
+
+        # feed scorer-reported stage timings into /metrics
+        if isinstance(parsed, dict):
+            for stage, seconds in (parsed.get('timings') or {}).items():
+                observe_metric('ml_api_scorer_stage_seconds', seconds, {'stage': stage})
+            if parsed.get('pred_count'):
+                inc_metric('ml_api_rows_scored_total', int(parsed['pred_count']))
+            if parsed.get('rows_per_second'):
+                observe_metric('ml_api_rows_scored_per_second', parsed['rows_per_second'],
+                               buckets=ROWS_PER_SECOND_BUCKETS)
+
         # If scorer wrote the CSV, ensure it exists and analyze results
-        if output_csv.exists():
+        if output_csv.exists() and isinstance(parsed_meta.get('summary'), dict):
+            # scorer.py computed the statistics from the in-memory predictions
+            parsed_meta['output_csv'] = str(output_csv)
+            parsed_meta.update({k: v for k, v in parsed_meta['summary'].items()
+                                if k not in ('confidence_sum', 'confidence_count')})
+        elif output_csv.exists():
             parsed_meta['output_csv'] = str(output_csv)
             
             # Analyze the CSV results to provide meaningful statistics
@@ -427,15 +656,216 @@ def predict():
         import traceback
         return jsonify({'success': False, 'error': str(e), 'traceback': traceback.format_exc()}), 500
 
+CLASS_NAMES = {0: 'Normal', 1: 'DoS', 2: 'Probe', 3: 'R2L', 4: 'U2R'}
+CLASS_IDS = {name.lower(): k for k, name in CLASS_NAMES.items()}
+
+def _parse_classes(value):
+    """'1,2' or 'DoS,Probe' -> [1, 2]"""
+    classes = []
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if part.lower() in CLASS_IDS:
+            classes.append(CLASS_IDS[part.lower()])
+        elif part.lower().startswith('class_'):
+            classes.append(int(part[6:]))
+        else:
+            classes.append(int(part))
+    return classes
+
+@app.route('/api/analysis/predictions/<filename>/query', methods=['GET'])
+@track_request('query')
+def query_predictions(filename):
+    """
+    Filter the stored predictions of one scoring run without downloading the CSV.
+    Query params: class (ids or names, comma separated), min_conf, max_conf,
+    start, end (epoch seconds), host (src or dst), sort (ts, -ts, confidence,
+    -confidence), offset, limit.
+    """
+    try:
+        store_dir = store_path_for(RESULTS_DIR / Path(filename).name)
+        if not (store_dir / 'meta.json').exists():
+            return jsonify({'error': 'No prediction store for this file (re-run predict to create one)'}), 404
+
+        args = request.args
+        try:
+            result = query_prediction_store(
+                store_dir,
+                classes=_parse_classes(args['class']) if args.get('class') else None,
+                min_conf=_number_arg(args, 'min_conf', float),
+                max_conf=_number_arg(args, 'max_conf', float),
+                start=_number_arg(args, 'start', float),
+                end=_number_arg(args, 'end', float),
+                host=args.get('host') or None,
+                sort=args.get('sort', 'ts'),
+                offset=_number_arg(args, 'offset', int, 0, minimum=0),
+                limit=_number_arg(args, 'limit', int, QUERY_DEFAULT_LIMIT, minimum=1),
+            )
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query: {e}'}), 400
+        result['file'] = Path(filename).name
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _rollup_response(filename, name, filters=None):
+    """Shared handler for the host/service rollup endpoints"""
+    store_dir = store_path_for(RESULTS_DIR / Path(filename).name)
+    if not (store_dir / f'{name}.csv').exists():
+        return jsonify({'error': f'No {name} rollup for this file (re-run predict to create one)'}), 404
+    args = request.args
+    nonzero = None
+    sort = args.get('sort', '-attacks')
+    try:
+        if args.get('class'):
+            classes = _parse_classes(args['class'])
+            if len(classes) != 1:
+                raise ValueError('class takes a single class')
+            nonzero = CLASS_NAMES.get(classes[0], f'Class_{classes[0]}')
+            sort = args.get('sort', f'-{nonzero}')
+        result = query_rollup(store_dir, name, filters=filters, nonzero=nonzero, sort=sort,
+                              offset=_number_arg(args, 'offset', int, 0, minimum=0),
+                              limit=_number_arg(args, 'limit', int, QUERY_DEFAULT_LIMIT, minimum=1))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query: {e}'}), 400
+    result['file'] = Path(filename).name
+    return jsonify(result)
+
+@app.route('/api/analysis/predictions/<filename>/hosts', methods=['GET'])
+@track_request('hosts')
+def prediction_hosts(filename):
+    """
+    Per-host rollup of one scoring run (one row per host and role).
+    Query params: role (src or dst), class (single id or name: only hosts
+    with that class, ranked by it), sort (column, '-' for descending;
+    default -attacks), offset, limit.
+    """
+    try:
+        role = request.args.get('role')
+        if role and role not in ('src', 'dst'):
+            return jsonify({'error': 'role must be src or dst'}), 400
+        return _rollup_response(filename, 'hosts', {'role': role} if role else None)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analysis/predictions/<filename>/hosts/<host>', methods=['GET'])
+@track_request('host_detail')
+def prediction_host_detail(filename, host):
+    """Drill-down for one host: its src/dst rollups and its most confident attack predictions"""
+    try:
+        store_dir = store_path_for(RESULTS_DIR / Path(filename).name)
+        if not (store_dir / 'hosts.csv').exists():
+            return jsonify({'error': 'No hosts rollup for this file (re-run predict to create one)'}), 404
+        try:
+            limit = _number_arg(request.args, 'limit', int, 20, minimum=1)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query: {e}'}), 400
+        roles = query_rollup(store_dir, 'hosts', filters={'host': host})['rows']
+        if not roles:
+            return jsonify({'error': 'Host not found'}), 404
+        attacks = query_prediction_store(store_dir, classes=[k for k in CLASS_NAMES if k != 0], host=host,
+                                         sort='-confidence', limit=limit)
+        return jsonify({
+            'file': Path(filename).name,
+            'host': host,
+            'roles': {r['role']: r for r in roles},
+            'attacks_matched': attacks['matched'],
+            'top_attacks': attacks['rows'],
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analysis/predictions/<filename>/services', methods=['GET'])
+@track_request('services')
+def prediction_services(filename):
+    """Per-service rollup of one scoring run; same class/sort/offset/limit params as /hosts"""
+    try:
+        return _rollup_response(filename, 'services')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analysis/alert-rollups', methods=['GET'])
+@track_request('alert_rollups')
+def alert_rollups():
+    """
+    Alert trend from the precomputed time rollups (no row-level data is read).
+    Query params: interval (1 or 60 seconds, default 60), start, end (epoch
+    seconds), step (re-bucket to a multiple of interval), class (ids or names).
+    Each point is one (bucket, class) with low/medium/high confidence counts.
+    """
+    try:
+        args = request.args
+        try:
+            result = query_time_rollups(
+                TIME_ROLLUPS_DIR,
+                interval=_number_arg(args, 'interval', int, 60),
+                start=_number_arg(args, 'start', float),
+                end=_number_arg(args, 'end', float),
+                step=_number_arg(args, 'step', int),
+                classes=_parse_classes(args['class']) if args.get('class') else None,
+            )
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query: {e}'}), 400
+        for point in result['points']:
+            point['class_name'] = CLASS_NAMES.get(point['class'], f"Class_{point['class']}")
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _file_etag(st):
+    return f'{st.st_mtime_ns:x}-{st.st_size:x}'
+
+def _iter_encoded(path, encoding):
+    """Read path in DOWNLOAD_CHUNK_BYTES chunks and yield them gzip/zstd encoded"""
+    if encoding == 'zstd':
+        comp = zstandard.ZstdCompressor(level=3).compressobj()
+    else:
+        comp = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(DOWNLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            out = comp.compress(chunk)
+            if out:
+                yield out
+    yield comp.flush()
+
 @app.route('/api/analysis/download/<filename>', methods=['GET'])
 def download_file(filename):
-    """Download generated files"""
+    """
+    Download generated files (RESULTS_DIR, then PCAP_DIR).
+    Range requests and identity transfers go through send_file (resumable,
+    206 partial content). Otherwise the file is streamed with gzip/zstd
+    content-encoding when the client accepts it. Both carry ETag and
+    Last-Modified, so repeat fetches get 304 Not Modified.
+    """
     try:
-        file_path = RESULTS_DIR / filename
-        if file_path.exists() and file_path.is_file():
-            return send_file(file_path, as_attachment=True)
-        else:
+        name = Path(filename).name
+        file_path = next((d / name for d in (RESULTS_DIR, PCAP_DIR) if (d / name).is_file()), None)
+        if file_path is None:
             return jsonify({'error': 'File not found'}), 404
+
+        st = file_path.stat()
+        etag = _file_etag(st)
+        offered = ['zstd', 'gzip'] if zstandard is not None else ['gzip']
+        encoding = request.accept_encodings.best_match(offered)
+        if (encoding is None or request.range is not None or st.st_size < COMPRESS_MIN_BYTES
+                or file_path.suffix.lower() in INCOMPRESSIBLE_SUFFIXES):
+            resp = send_file(file_path, as_attachment=True, conditional=True, etag=etag,
+                             last_modified=st.st_mtime, max_age=0)
+        else:
+            resp = Response(_iter_encoded(file_path, encoding), mimetype='application/octet-stream',
+                            direct_passthrough=True)
+            resp.headers['Content-Encoding'] = encoding
+            resp.headers['Content-Disposition'] = f'attachment; filename="{name}"'
+            resp.set_etag(f'{etag}-{encoding}')
+            resp.last_modified = st.st_mtime
+            resp.cache_control.no_cache = True
+            resp = resp.make_conditional(request)
+        resp.vary.add('Accept-Encoding')
+        return resp
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -497,7 +927,9 @@ def reload_model():
         path = Path(os.environ.get('ML_MODEL_PATH', str(MODEL_PATH)))
         if not path.exists():
             return jsonify({'success': False, 'error': f'Model file not found: {path}'}), 400
+        t0 = time.perf_counter()
         model = joblib.load(path)
+        set_metric('ml_api_model_load_seconds', time.perf_counter() - t0)
         return jsonify({'success': True, 'message': f'Model reloaded from {path}'}), 200
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,179 @@
+"""
+ip_reputation.py
+- Loads CIDR allowlists / blocklists (one address or CIDR per line, optional label after it, '#' comments)
+- Compiles each list into a longest-prefix-match index: one sorted array of network addresses per
+  prefix length, probed most-specific first with np.searchsorted (IPv4 fully vectorized as uint32)
+- tag_hosts() labels a column of addresses via its distinct values only, then maps back by code
+- Blocklist matches take precedence over allowlist matches for the same address
+"""
+from pathlib import Path
+import ipaddress
+import socket
+
+import joblib
+import numpy as np
+import pandas as pd
+
+INDEX_VERSION = 1
+
+class PrefixIndex:
+    """
+    Longest-prefix-match lookup over one list. IPv4 prefixes are held as
+    {prefixlen: (sorted uint32 networks, label ids)}; IPv6 (rare in lists,
+    lookups done per distinct address) as {prefixlen: {network int: label id}}.
+    """
+    def __init__(self, kind):
+        self.kind = kind
+        self.labels = []
+        self.v4 = {}
+        self.v6 = {}
+        self.n_entries = 0
+
+    def _label_id(self, label, ids):
+        if label not in ids:
+            ids[label] = len(self.labels)
+            self.labels.append(label)
+        return ids[label]
+
+    def load(self, path):
+        """Add every entry of a list file; the default label is the file stem"""
+        path = Path(path)
+        ids = {label: i for i, label in enumerate(self.labels)}
+        v4 = {}
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                if not line:
+                    continue
+                parts = line.split(None, 1)
+                try:
+                    net = ipaddress.ip_network(parts[0], strict=False)
+                except ValueError:
+                    continue
+                label = self._label_id(parts[1].strip() if len(parts) > 1 else path.stem, ids)
+                if net.version == 4:
+                    v4.setdefault(net.prefixlen, {})[int(net.network_address)] = label
+                else:
+                    self.v6.setdefault(net.prefixlen, {})[int(net.network_address)] = label
+                self.n_entries += 1
+        for plen, entries in v4.items():
+            if plen in self.v4:
+                nets, lab = self.v4[plen]
+                entries = {**dict(zip(nets.tolist(), lab.tolist())), **entries}
+            nets = np.fromiter(entries.keys(), dtype=np.uint32, count=len(entries))
+            lab = np.fromiter(entries.values(), dtype=np.int32, count=len(entries))
+            order = np.argsort(nets)
+            self.v4[plen] = (nets[order], lab[order])
+        return self
+
+    def lookup_v4(self, addrs):
+        """uint32 addresses -> label ids (-1 = no match), most specific prefix wins"""
+        out = np.full(len(addrs), -1, dtype=np.int32)
+        for plen in sorted(self.v4, reverse=True):
+            todo = np.flatnonzero(out < 0)
+            if not len(todo):
+                break
+            nets, lab = self.v4[plen]
+            mask = np.uint32((0xFFFFFFFF << (32 - plen)) & 0xFFFFFFFF)
+            probe = addrs[todo] & mask
+            pos = np.minimum(np.searchsorted(nets, probe), len(nets) - 1)
+            hit = nets[pos] == probe
+            out[todo[hit]] = lab[pos[hit]]
+        return out
+
+    def lookup_v6(self, addr):
+        for plen in sorted(self.v6, reverse=True):
+            net = (addr >> (128 - plen)) << (128 - plen)
+            label = self.v6[plen].get(net)
+            if label is not None:
+                return label
+        return -1
+
+def _parse_addresses(values):
+    """
+    Distinct address strings -> (uint32 IPv4 values, is_v4 mask, {position:
+    IPv6 int}). inet_pton only accepts canonical dotted quads / IPv6 text,
+    so zone ids are stripped and anything else (e.g. '-') is left unmatched.
+    """
+    packed = bytearray(4 * len(values))
+    is_v4 = np.zeros(len(values), dtype=bool)
+    v6 = {}
+    for i, addr in enumerate(values):
+        addr = str(addr)
+        try:
+            packed[4 * i:4 * i + 4] = socket.inet_pton(socket.AF_INET, addr)
+            is_v4[i] = True
+        except OSError:
+            if ':' in addr:
+                try:
+                    v6[i] = int.from_bytes(socket.inet_pton(socket.AF_INET6, addr.split('%', 1)[0]), 'big')
+                except OSError:
+                    pass
+    return np.frombuffer(bytes(packed), dtype='>u4').astype(np.uint32), is_v4, v6
+
+class ReputationIndex:
+    """Allowlist + blocklist indexes; tag() returns 'block:<label>' / 'allow:<label>' / ''"""
+    def __init__(self, allow_paths=(), block_paths=()):
+        self.allow = PrefixIndex('allow')
+        self.block = PrefixIndex('block')
+        for p in allow_paths:
+            self.allow.load(p)
+        for p in block_paths:
+            self.block.load(p)
+
+    def __bool__(self):
+        return bool(self.allow.n_entries or self.block.n_entries)
+
+    def tag(self, values):
+        """Distinct address strings -> array of tags (object dtype)"""
+        v4, is_v4, v6 = _parse_addresses(values)
+        tags = np.full(len(v4), '', dtype=object)
+        # allow first, then block overwrites: a blocklist match always wins
+        for index in (self.allow, self.block):
+            ids = np.full(len(v4), -1, dtype=np.int32)
+            ids[is_v4] = index.lookup_v4(v4[is_v4])
+            for i, addr in v6.items():
+                ids[i] = index.lookup_v6(addr)
+            names = np.array([f'{index.kind}:{label}' for label in index.labels] + [''], dtype=object)
+            hit = ids >= 0
+            tags[hit] = names[ids[hit]]
+        return tags
+
+def load_reputation_index(allow_paths=(), block_paths=(), cache_path=None):
+    """
+    Build the index, reusing a joblib-compiled copy at cache_path while the
+    list files (path, size, mtime) are unchanged.
+    """
+    allow_paths = [Path(p) for p in allow_paths]
+    block_paths = [Path(p) for p in block_paths]
+    key = (INDEX_VERSION,
+           tuple((str(p.resolve()), p.stat().st_size, p.stat().st_mtime_ns) for p in allow_paths),
+           tuple((str(p.resolve()), p.stat().st_size, p.stat().st_mtime_ns) for p in block_paths))
+    if cache_path and Path(cache_path).exists():
+        try:
+            cached = joblib.load(str(cache_path))
+            if cached.get('key') == key:
+                return cached['index']
+        except Exception:
+            pass
+    index = ReputationIndex(allow_paths, block_paths)
+    if cache_path:
+        try:
+            tmp = Path(f'{cache_path}.tmp')
+            joblib.dump({'key': key, 'index': index}, str(tmp))
+            tmp.replace(cache_path)
+        except Exception:
+            pass
+    return index
+
+def tag_hosts(index, column):
+    """
+    Tag a column of addresses (categorical or plain): lookups run once per
+    distinct address and are mapped back to rows by code.
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        categories, codes = column.cat.categories.to_numpy(), column.cat.codes.to_numpy()
+    else:
+        codes, categories = pd.factorize(column, use_na_sentinel=True)
+    tags = np.append(index.tag(categories), '')   # code -1 (missing) -> ''
+    return tags[codes]
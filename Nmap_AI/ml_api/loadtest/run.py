@@ -0,0 +1,296 @@
+"""
+loadtest/run.py
+- End-to-end load test of the ML API on a plain Linux box (no Zeek, no capture interface)
+- Copies the API into a scratch workdir, puts the zeek/tcpdump stand-ins (loadtest/bin) first on
+  PATH and starts the Flask app there; the stand-ins replay canned pcaps/conn logs with
+  configurable latency and failure rate
+- Concurrent clients hit a weighted mix of endpoints for --duration seconds
+- Reports per-endpoint requests, errors, error rate, throughput and p50/p95/p99 latency (table + JSON)
+- CLI: python loadtest/run.py --clients 8 --duration 60 --mix score=1,predict=1,query=4,health=2
+       [--url http://host:5000 to target an already running API instead]
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+# ---------- CONFIG ----------
+HERE = Path(__file__).parent.resolve()
+API_DIR = HERE.parent
+BIN_DIR = HERE / 'bin'
+API_MODULES = ['app.py', 'scorer.py', 'prediction_store.py', 'ip_reputation.py']
+MODEL_NAME = 'network_anomaly_detection_model.joblib'
+DEFAULT_MIX = 'score=1,predict=1,query=4,alert_rollups=2,health=2,metrics=1'
+REQUEST_TIMEOUT = 600
+STARTUP_TIMEOUT = 60
+PERCENTILES = (50, 95, 99)
+# ----------------------------
+
+def _newest(paths):
+    paths = [p for p in paths if p.stat().st_size > 24]   # 24 bytes = empty pcap (header only)
+    return max(paths, key=lambda p: p.stat().st_mtime) if paths else None
+
+def default_pcap():
+    return _newest(list((API_DIR / 'pcaps').glob('*.pcap')))
+
+def default_conn_log():
+    return _newest(list((API_DIR / 'results').glob('zeek_*/conn*.log')))
+
+def parse_mix(spec):
+    """'score=1,predict=2' -> {'score': 1.0, 'predict': 2.0}"""
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.strip().partition('=')
+        if name not in ENDPOINTS:
+            raise SystemExit(f'unknown endpoint {name!r}; choose from {", ".join(ENDPOINTS)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+def prepare_workdir(workdir, args):
+    """Copy the API modules and model into workdir and seed a pcap + conn log"""
+    workdir.mkdir(parents=True, exist_ok=True)
+    for name in API_MODULES:
+        shutil.copy2(API_DIR / name, workdir / name)
+    if args.model:
+        shutil.copy2(args.model, workdir / MODEL_NAME)
+    if (API_DIR / 'reputation').is_dir():
+        shutil.copytree(API_DIR / 'reputation', workdir / 'reputation', dirs_exist_ok=True)
+    (workdir / 'pcaps').mkdir(exist_ok=True)
+    shutil.copy2(args.pcap, workdir / 'pcaps' / 'capture_seed.pcap')
+    seed_dir = workdir / 'results' / 'zeek_seed'
+    seed_dir.mkdir(parents=True, exist_ok=True)
+    shutil.copy2(args.conn_log, seed_dir / 'conn_seed.log')
+
+def start_server(workdir, port, args):
+    """Run the Flask app (threaded) from workdir with the stand-ins on PATH"""
+    env = dict(os.environ)
+    env['PATH'] = f'{BIN_DIR}{os.pathsep}{env.get("PATH", "")}'
+    env.update({
+        'LOADTEST_CONN_LOG': str(Path(args.conn_log).resolve()),
+        'LOADTEST_PCAP': str(Path(args.pcap).resolve()),
+        'LOADTEST_ZEEK_LATENCY': args.zeek_latency,
+        'LOADTEST_ZEEK_FAIL_RATE': str(args.zeek_fail_rate),
+        'LOADTEST_TCPDUMP_LATENCY': args.tcpdump_latency,
+        'PYTHONUNBUFFERED': '1',
+    })
+    log = open(workdir / 'server.log', 'w', encoding='utf-8')
+    proc = subprocess.Popen(
+        [sys.executable, '-c', f'import app; app.app.run(host="127.0.0.1", port={port}, threaded=True)'],
+        cwd=str(workdir), env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f'API exited during startup; see {workdir / "server.log"}')
+        try:
+            urllib.request.urlopen(f'{url}/health', timeout=1).read()
+            return proc, url
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit(f'API did not come up within {STARTUP_TIMEOUT}s; see {workdir / "server.log"}')
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+class Client:
+    """One HTTP session's worth of state shared by the worker threads"""
+    def __init__(self, url):
+        self.url = url
+        self.query_path = None   # learned from predict responses
+        self.lock = threading.Lock()
+
+    def call(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.url + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'} if data else {})
+        try:
+            with urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT) as resp:
+                return resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+def _score(client):
+    return client.call('POST', '/api/analysis/score', {})
+
+def _predict(client):
+    status, body = client.call('POST', '/api/analysis/predict', {'max_alerts': 10})
+    if status == 200:
+        try:
+            query_url = json.loads(body).get('query_url')
+        except ValueError:
+            query_url = None
+        if query_url:
+            with client.lock:
+                client.query_path = query_url
+    return status, body
+
+def _query(client):
+    path = client.query_path
+    if path is None:
+        return None   # nothing scored yet: not counted
+    return client.call('GET', f'{path}?class=1,2,3,4&sort=-confidence&limit=50')
+
+def _capture(client):
+    status, body = client.call('POST', '/api/analysis/start-tcpdump', {'duration': 1, 'interface': 'lo'})
+    if status != 200:
+        return status, body
+    return client.call('POST', '/api/analysis/stop-tcpdump')
+
+ENDPOINTS = {
+    'score': _score,
+    'predict': _predict,
+    'query': _query,
+    'alert_rollups': lambda c: c.call('GET', '/api/analysis/alert-rollups?interval=60'),
+    'health': lambda c: c.call('GET', '/health'),
+    'metrics': lambda c: c.call('GET', '/metrics'),
+    'capture': _capture,
+}
+
+def run_load(client, mix, clients, duration, seed):
+    """
+    Drive the mix from `clients` threads for `duration` seconds.
+    Returns ({endpoint: [(seconds, ok)]}, {endpoint: {error kind: count}}, wall seconds).
+    """
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    samples = {n: [] for n in names}
+    errors = {n: {} for n in names}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(i):
+        rng = random.Random(seed + i)
+        while time.monotonic() < deadline:
+            name = rng.choices(names, weights)[0]
+            t0 = time.perf_counter()
+            try:
+                result = ENDPOINTS[name](client)
+                if result is None:
+                    continue
+                status = result[0]
+                error = None if 200 <= status < 400 else f'HTTP {status}'
+            except Exception as e:
+                error = type(e).__name__
+            elapsed = time.perf_counter() - t0
+            with lock:
+                samples[name].append((elapsed, error is None))
+                if error:
+                    errors[name][error] = errors[name].get(error, 0) + 1
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(worker, range(clients)))
+    return samples, errors, time.perf_counter() - t0
+
+def summarize(samples, errors, wall):
+    """Per-endpoint and overall request/error/latency statistics"""
+    report = {}
+    everything = []
+    for name, rows in samples.items():
+        everything.extend(rows)
+        report[name] = _stats(rows, wall)
+        report[name]['error_kinds'] = errors[name]
+    report['total'] = _stats(everything, wall)
+    return report
+
+def _stats(rows, wall):
+    lat = np.array([r[0] for r in rows], dtype=float)
+    failed = sum(1 for r in rows if not r[1])
+    out = {
+        'requests': len(rows),
+        'errors': failed,
+        'error_rate': failed / len(rows) if rows else 0.0,
+        'throughput_rps': len(rows) / wall if wall else 0.0,
+    }
+    for p in PERCENTILES:
+        out[f'p{p}_ms'] = float(np.percentile(lat, p) * 1000) if len(lat) else None
+    return out
+
+def print_report(report):
+    cols = ['requests', 'errors', 'error_rate', 'throughput_rps'] + [f'p{p}_ms' for p in PERCENTILES]
+    print(f"{'endpoint':<14}" + ''.join(f'{c:>15}' for c in cols))
+    for name, row in report.items():
+        cells = []
+        for c in cols:
+            v = row[c]
+            cells.append(f'{"-":>15}' if v is None else f'{v:>15.3f}' if isinstance(v, float) else f'{v:>15}')
+        print(f'{name:<14}' + ''.join(cells))
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the ML API with zeek/tcpdump stand-ins')
+    parser.add_argument('--url', help='Target a running API instead of starting one (stand-ins not used)')
+    parser.add_argument('--clients', type=int, default=4, help='Concurrent client threads')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of load')
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help=f'Endpoint weights, from: {", ".join(ENDPOINTS)} (default: {DEFAULT_MIX})')
+    parser.add_argument('--pcap', default=None, help='Canned pcap the tcpdump stand-in writes (default: newest non-empty ml_api/pcaps/*.pcap)')
+    parser.add_argument('--conn_log', default=None, help='Canned conn log the zeek stand-in emits (default: newest ml_api/results/zeek_*/conn*.log)')
+    parser.add_argument('--model', default=None, help=f'Model to serve (default: ml_api/{MODEL_NAME} if present)')
+    parser.add_argument('--zeek_latency', default='0.5', help="Stand-in Zeek run time in seconds, or 'min:max'")
+    parser.add_argument('--zeek_fail_rate', type=float, default=0.0, help='Share of stand-in Zeek runs that fail')
+    parser.add_argument('--tcpdump_latency', default='0.1', help="Stand-in tcpdump start-up time in seconds, or 'min:max'")
+    parser.add_argument('--workdir', default=None, help='Scratch copy of the API (default: a temp dir, removed afterwards)')
+    parser.add_argument('--report', default=None, help='Write the report JSON here')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the endpoint mix')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    proc = None
+    tmp = None
+    try:
+        if args.url:
+            url = args.url.rstrip('/')
+        else:
+            args.pcap = args.pcap or default_pcap()
+            args.conn_log = args.conn_log or default_conn_log()
+            if not args.pcap or not args.conn_log:
+                raise SystemExit('need --pcap and --conn_log (no canned files found under ml_api/)')
+            if args.model is None and (API_DIR / MODEL_NAME).exists():
+                args.model = API_DIR / MODEL_NAME
+            if args.workdir:
+                workdir = Path(args.workdir)
+            else:
+                tmp = tempfile.mkdtemp(prefix='ml_api_loadtest_')
+                workdir = Path(tmp)
+            prepare_workdir(workdir, args)
+            proc, url = start_server(workdir, _free_port(), args)
+
+        client = Client(url)
+        if 'query' in mix:
+            _predict(client)   # warm-up so query has a predictions file to hit
+        samples, errors, wall = run_load(client, mix, args.clients, args.duration, args.seed)
+        report = summarize(samples, errors, wall)
+        print_report(report)
+        result = {'url': url, 'clients': args.clients, 'duration': wall, 'mix': mix,
+                  'zeek_latency': args.zeek_latency, 'zeek_fail_rate': args.zeek_fail_rate,
+                  'endpoints': report}
+        if args.report:
+            Path(args.report).write_text(json.dumps(result, indent=2), encoding='utf-8')
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
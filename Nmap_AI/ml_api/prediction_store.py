@@ -0,0 +1,320 @@
+"""
+prediction_store.py
+- Columnar store of scored connections written by scorer.py next to the predictions CSV
+- One .npy file per column (memory-mapped on read) plus meta.json; rows are sorted by ts
+- String columns (src, dst, service, proto, allow/blocklist tags) are dictionary-encoded: int32 codes + categories in meta.json
+- query_prediction_store() filters by class, confidence range, time range and host, with pagination
+- Per-host / per-service rollups computed by scorer.py are kept in the store as <name>.csv (query_rollup)
+- Time-bucketed counts (per second / per minute, by class and confidence bucket) are appended across
+  runs to fixed-width binary logs (<dir>/alerts_<interval>s.bin); readers sum duplicate keys, so
+  runs merge without rewriting (append_time_rollups / query_time_rollups)
+"""
+from pathlib import Path
+import json
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:  # Windows: rollup appends are not locked
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+STORE_VERSION = 1
+STORE_SUFFIX = '.store'
+# conn_df column -> store column for the dictionary-encoded fields
+STORE_STRING_COLUMNS = {'id.orig_h': 'src', 'id.resp_h': 'dst', 'service': 'service', 'proto': 'proto',
+                        'src_list': 'src_list', 'dst_list': 'dst_list'}
+QUERY_DEFAULT_LIMIT = 100
+QUERY_MAX_LIMIT = 1000
+QUERY_SORTS = ('ts', '-ts', 'confidence', '-confidence')
+ROLLUP_NAMES = ('hosts', 'services')
+# time rollups: one record per (bucket start, class, confidence bucket) with a count
+TIME_ROLLUP_INTERVALS = (1, 60)
+TIME_ROLLUP_DTYPE = np.dtype([('bucket', '<i8'), ('cls', '<i2'), ('conf', '<i2'), ('count', '<i4')])
+CONF_BUCKETS = ('low', 'medium', 'high')   # < 0.6, 0.6-0.8, > 0.8 (same split as the predict summary)
+TIME_ROLLUP_MAX_POINTS = 10000
+
+def store_path_for(predictions_csv):
+    """predictions_<ts>.csv -> predictions_<ts>.store"""
+    p = Path(predictions_csv)
+    return p.with_name(p.stem + STORE_SUFFIX)
+
+def _encode_strings(values):
+    cat = pd.Categorical(values)
+    return cat.codes.astype(np.int32), [str(c) for c in cat.categories]
+
+def write_prediction_store(conn_df, preds, confidences, store_dir, rollups=None, weights=None):
+    """
+    Write the store for one scoring run. 'row' keeps each record's position
+    in the predictions CSV; rollups ({name: DataFrame}) are saved as CSVs.
+    weights (load-shed runs) are kept as a 'weight' column and the store is
+    marked sampled: rows are the scored sample, rollups weighted estimates.
+    Written to a temp dir, then the previous store is renamed aside and the
+    new one renamed in before the old copy is deleted: readers never see a
+    half-written store, and the path is missing only between the two
+    renames (not for a whole rmtree). Returns the store path.
+    """
+    store_dir = Path(store_dir)
+    n = len(conn_df)
+    ts = pd.to_numeric(conn_df['ts'], errors='coerce').to_numpy(dtype=np.float64) if 'ts' in conn_df.columns else np.full(n, np.nan)
+    order = np.argsort(ts, kind='stable')  # NaN ts sort last
+
+    columns = {
+        'ts': ts[order],
+        'row': order.astype(np.int64),
+        'predicted_class': np.asarray(preds).astype(np.int16)[order],
+        'confidence': np.asarray(confidences, dtype=np.float32)[order],
+    }
+    if weights is not None:
+        columns['weight'] = np.asarray(weights, dtype=np.float32)[order]
+    categories = {}
+    for src_col, name in STORE_STRING_COLUMNS.items():
+        if src_col not in conn_df.columns:
+            continue
+        codes, cats = _encode_strings(conn_df[src_col].to_numpy())
+        columns[name] = codes[order]
+        categories[name] = cats
+
+    tmp = store_dir.with_name(f'{store_dir.name}.{os.getpid()}.tmp')
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    for name, arr in columns.items():
+        np.save(tmp / f'{name}.npy', arr)
+    for name, frame in (rollups or {}).items():
+        frame.to_csv(tmp / f'{name}.csv', index=False)
+    valid_ts = columns['ts'][~np.isnan(columns['ts'])]
+    meta = {
+        'version': STORE_VERSION,
+        'n_rows': int(n),
+        'sorted_by': 'ts',
+        'sampled': weights is not None,
+        'columns': list(columns),
+        'rollups': sorted(rollups or {}),
+        'categories': categories,
+        'ts_min': float(valid_ts[0]) if len(valid_ts) else None,
+        'ts_max': float(valid_ts[-1]) if len(valid_ts) else None,
+    }
+    (tmp / 'meta.json').write_text(json.dumps(meta), encoding='utf-8')
+    old = store_dir.with_name(f'{store_dir.name}.{os.getpid()}.old')
+    shutil.rmtree(old, ignore_errors=True)
+    if store_dir.exists():
+        os.replace(store_dir, old)
+    os.replace(tmp, store_dir)
+    shutil.rmtree(old, ignore_errors=True)
+    return store_dir
+
+def load_prediction_store(store_dir):
+    """Returns (meta, {column: memory-mapped array})"""
+    store_dir = Path(store_dir)
+    meta = json.loads((store_dir / 'meta.json').read_text(encoding='utf-8'))
+    if meta.get('version') != STORE_VERSION:
+        raise ValueError(f"unsupported store version {meta.get('version')}")
+    cols = {name: np.load(store_dir / f'{name}.npy', mmap_mode='r') for name in meta['columns']}
+    return meta, cols
+
+def query_prediction_store(store_dir, classes=None, min_conf=None, max_conf=None,
+                           start=None, end=None, host=None, sort='ts',
+                           offset=0, limit=QUERY_DEFAULT_LIMIT):
+    """
+    Filter one store. The time range is resolved by binary search on the
+    ts-sorted columns; the remaining filters are vectorized over that slice
+    only. host matches src or dst. Returns a JSON-ready dict with the total
+    match count and one page of rows.
+    """
+    if sort not in QUERY_SORTS:
+        raise ValueError(f'sort must be one of {", ".join(QUERY_SORTS)}')
+    offset = max(0, int(offset))
+    limit = max(0, min(int(limit), QUERY_MAX_LIMIT))
+    meta, cols = load_prediction_store(store_dir)
+
+    ts = cols['ts']
+    lo = int(np.searchsorted(ts, start, side='left')) if start is not None else 0
+    hi = int(np.searchsorted(ts, end, side='right')) if end is not None else meta['n_rows']
+    mask = np.ones(max(hi - lo, 0), dtype=bool)
+    if classes:
+        mask &= np.isin(cols['predicted_class'][lo:hi], np.asarray(classes, dtype=np.int16))
+    if min_conf is not None:
+        mask &= cols['confidence'][lo:hi] >= min_conf
+    if max_conf is not None:
+        mask &= cols['confidence'][lo:hi] <= max_conf
+    if host:
+        host_mask = np.zeros_like(mask)
+        for name in ('src', 'dst'):
+            cats = meta['categories'].get(name)
+            if cats and host in cats:
+                host_mask |= cols[name][lo:hi] == cats.index(host)
+        mask &= host_mask
+
+    idx = np.flatnonzero(mask) + lo
+    if sort != 'ts':
+        key = np.asarray(cols[sort.lstrip('-')][idx])
+        # stable sort keeps ts order among ties; '-' reverses the key, not the ties
+        idx = idx[np.argsort(-key if sort.startswith('-') else key, kind='stable')]
+    page = idx[offset:offset + limit]
+
+    rows = {
+        'row': np.asarray(cols['row'][page]).tolist(),
+        'ts': [None if np.isnan(v) else v for v in np.asarray(cols['ts'][page]).tolist()],
+        'predicted_class': np.asarray(cols['predicted_class'][page]).tolist(),
+        'confidence': [None if np.isnan(v) else round(v, 6)
+                       for v in np.asarray(cols['confidence'][page], dtype=float).tolist()],
+    }
+    if 'weight' in cols:
+        rows['weight'] = [round(v, 3) for v in np.asarray(cols['weight'][page], dtype=float).tolist()]
+    for name, cats in meta['categories'].items():
+        rows[name] = [cats[c] if c >= 0 else None for c in np.asarray(cols[name][page]).tolist()]
+    names = list(rows)
+    next_offset = offset + len(page)
+    return {
+        'total_rows': meta['n_rows'],
+        'sampled': meta.get('sampled', False),
+        'matched': int(len(idx)),
+        'offset': offset,
+        'limit': limit,
+        'next_offset': next_offset if len(page) and next_offset < len(idx) else None,
+        'rows': [dict(zip(names, vals)) for vals in zip(*(rows[n] for n in names))],
+    }
+
+def query_rollup(store_dir, name, filters=None, nonzero=None, sort=None,
+                 offset=0, limit=QUERY_DEFAULT_LIMIT):
+    """
+    Page through one rollup table. filters maps column -> value (exact
+    match); nonzero keeps rows where that count column is > 0 (a class
+    that never occurred matches nothing); sort is a column name, '-'
+    prefix for descending.
+    Returns a JSON-ready dict like query_prediction_store(); 'sampled'
+    marks rollups of a load-shed run (weighted estimates).
+    """
+    if name not in ROLLUP_NAMES:
+        raise ValueError(f'unknown rollup {name!r}')
+    path = Path(store_dir) / f'{name}.csv'
+    if not path.exists():
+        raise FileNotFoundError(f'no {name} rollup in {store_dir}')
+    offset = max(0, int(offset))
+    limit = max(0, min(int(limit), QUERY_MAX_LIMIT))
+    df = pd.read_csv(path, keep_default_na=False, na_values=[''])
+    for col, value in (filters or {}).items():
+        if col not in df.columns:
+            raise ValueError(f'unknown column {col!r}')
+        df = df[df[col].astype(str) == str(value)]
+    if nonzero:
+        df = df[df[nonzero] > 0] if nonzero in df.columns else df.iloc[0:0]
+    if sort:
+        col = sort.lstrip('-')
+        if col not in df.columns and col != nonzero:
+            raise ValueError(f'unknown sort column {col!r}')
+        if col in df.columns:
+            df = df.sort_values(col, ascending=not sort.startswith('-'), kind='stable')
+    page = df.iloc[offset:offset + limit]
+    next_offset = offset + len(page)
+    meta_path = Path(store_dir) / 'meta.json'
+    meta = json.loads(meta_path.read_text(encoding='utf-8')) if meta_path.exists() else {}
+    return {
+        'sampled': meta.get('sampled', False),
+        'matched': int(len(df)),
+        'offset': offset,
+        'limit': limit,
+        'next_offset': next_offset if len(page) and next_offset < len(df) else None,
+        'rows': json.loads(page.to_json(orient='records')),
+    }
+
+def time_rollup_path(rollup_dir, interval):
+    return Path(rollup_dir) / f'alerts_{int(interval)}s.bin'
+
+def time_rollup_records(ts, preds, confidences, interval, weights=None):
+    """
+    Vectorized bucketing of one scoring run: floor(ts / interval) x class x
+    confidence bucket -> count, as TIME_ROLLUP_DTYPE records. Rows without
+    a ts are skipped; with weights (sampled runs) counts are rounded sums.
+    """
+    ts = np.asarray(ts, dtype=np.float64)
+    valid = ~np.isnan(ts)
+    conf = np.asarray(confidences, dtype=float)[valid]
+    keys = np.empty(int(valid.sum()), dtype=[('bucket', '<i8'), ('cls', '<i2'), ('conf', '<i2')])
+    keys['bucket'] = (np.floor(ts[valid] / interval) * interval).astype(np.int64)
+    keys['cls'] = np.asarray(preds)[valid]
+    keys['conf'] = (conf >= 0.6).astype(np.int16) + (conf > 0.8)
+    if weights is None:
+        uniq, counts = np.unique(keys, return_counts=True)
+    else:
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        counts = np.round(np.bincount(inverse.ravel(), weights=np.asarray(weights, dtype=float)[valid]))
+    records = np.empty(len(uniq), dtype=TIME_ROLLUP_DTYPE)
+    for name in ('bucket', 'cls', 'conf'):
+        records[name] = uniq[name]
+    records['count'] = counts
+    return records
+
+def append_time_rollups(rollup_dir, ts, preds, confidences, intervals=TIME_ROLLUP_INTERVALS, source=None,
+                        weights=None):
+    """
+    Append one run's bucket counts to every interval's log. The whole update
+    (ledger check, appends, ledger entry) runs under one exclusive lock on
+    ingested.txt, so concurrent scorers interleave whole runs and readers
+    never see a torn record. source (e.g. 'path:size:mtime') is recorded in
+    the ledger; a source already recorded is skipped so re-scoring the same
+    log, even from two requests at once, does not double count.
+    Returns {interval: records appended}.
+    """
+    rollup_dir = Path(rollup_dir)
+    rollup_dir.mkdir(parents=True, exist_ok=True)
+    with open(rollup_dir / 'ingested.txt', 'a+', encoding='utf-8') as ledger:
+        if fcntl is not None:
+            fcntl.flock(ledger, fcntl.LOCK_EX)
+        if source is not None:
+            ledger.seek(0)
+            if source in ledger.read().splitlines():
+                return {}
+        written = {}
+        for interval in intervals:
+            records = time_rollup_records(ts, preds, confidences, interval, weights)
+            with open(time_rollup_path(rollup_dir, interval), 'ab') as f:
+                f.write(records.tobytes())
+            written[interval] = int(len(records))
+        if source is not None:
+            ledger.write(source + '\n')
+            ledger.flush()
+        return written
+
+def _read_time_rollups(path):
+    if not path.exists():
+        return np.empty(0, dtype=TIME_ROLLUP_DTYPE)
+    n = path.stat().st_size // TIME_ROLLUP_DTYPE.itemsize  # ignore a torn trailing record
+    return np.fromfile(path, dtype=TIME_ROLLUP_DTYPE, count=n)
+
+def query_time_rollups(rollup_dir, interval, start=None, end=None, step=None, classes=None):
+    """
+    Sum the logged counts for buckets in [start, end], optionally re-bucketed
+    to a coarser step (a multiple of interval). Returns a JSON-ready dict
+    with one point per (bucket, class): counts per confidence bucket + total.
+    """
+    if interval not in TIME_ROLLUP_INTERVALS:
+        raise ValueError(f'interval must be one of {", ".join(map(str, TIME_ROLLUP_INTERVALS))}')
+    step = int(step or interval)
+    if step < interval or step % interval:
+        raise ValueError(f'step must be a multiple of {interval}')
+    rec = _read_time_rollups(time_rollup_path(rollup_dir, interval))
+    mask = np.ones(len(rec), dtype=bool)
+    if start is not None:
+        mask &= rec['bucket'] >= np.floor(start / interval) * interval
+    if end is not None:
+        mask &= rec['bucket'] <= end
+    if classes:
+        mask &= np.isin(rec['cls'], classes)
+    rec = rec[mask]
+
+    bucket = rec['bucket'] // step * step
+    keys = np.stack([bucket, rec['cls'].astype(np.int64)], axis=1)
+    uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+    if len(uniq) > TIME_ROLLUP_MAX_POINTS:
+        raise ValueError(f'{len(uniq)} points in range; narrow it or use a larger step')
+    counts = np.zeros((len(uniq), len(CONF_BUCKETS)), dtype=np.int64)
+    np.add.at(counts, (inverse.ravel(), rec['conf']), rec['count'])
+    points = [
+        {'ts': int(b), 'class': int(c), **dict(zip(CONF_BUCKETS, map(int, row))), 'total': int(row.sum())}
+        for (b, c), row in zip(uniq.tolist(), counts)
+    ]
+    return {'interval': interval, 'step': step, 'start': start, 'end': end, 'points': points}
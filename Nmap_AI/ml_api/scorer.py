@@ -3,19 +3,52 @@ scorer.py
 - Parses Zeek conn.* logs (handles #fields header)
 - Produces a CSV of parsed records (output)
 - Optionally loads a joblib model and predicts (adds predicted_class, confidence)
-- CLI: --zeek_conn <path> --model <path> --output <path>
+- Writes a capped, deduplicated JSONL alert stream (<output>_alerts.jsonl) when a model is given
+- Writes a queryable columnar store of the predictions (<output>.store, see prediction_store.py)
+  with per-host and per-service rollups (connections, attacks by class, max confidence, bytes)
+- --row_budget/--time_budget shed load: priority traffic is scored fully, the bulk by stratified sample,
+  and class counts are reported as estimates with 95% bounds ('sampled': true)
+- --allowlist/--blocklist tag src/dst against CIDR lists (ip_reputation.py); --skip_allowlisted keeps
+  allowlisted flows out of inference
+- --time_rollups_dir appends per-second/per-minute counts by class and confidence bucket (mergeable across runs)
+- --follow tails a live conn.log (rotation aware, offset checkpoints) and scores appended records in micro-batches
+- Several logs (globs/directories) are scored across a process pool with one merged summary JSON
+- CLI: --zeek_conn <path|glob|dir> [...] --model <path> --output <path> [--profile] [--alerts_output <path>] [--follow]
 """
+from collections import OrderedDict
+from contextlib import contextmanager
+from operator import itemgetter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 import argparse
+import cProfile
+import glob
+import hashlib
+import io
+import os
+import pstats
+import tracemalloc
 import joblib
 import pandas as pd
 import numpy as np
 import sys
 import json
+import signal
+import time
+
+from ip_reputation import load_reputation_index, tag_hosts
+from prediction_store import append_time_rollups, store_path_for, write_prediction_store
 
 # ---------- CONFIG ----------
 WINDOW_SECONDS = 2.0
 ALERT_PROB_THRESHOLD = 0.6
+ALERT_TOP_K = 10000          # max alerts written (0 = unlimited)
+ALERT_PER_CLASS_CAP = 2000   # max alerts per predicted class (0 = unlimited)
+# conn.log columns carried into alert records (renamed), dedup key is (src, dst, service)
+ALERT_META_COLUMNS = {'ts': 'ts', 'id.orig_h': 'src', 'id.resp_h': 'dst', 'service': 'service',
+                      'proto': 'proto', 'conn_state': 'conn_state',
+                      'src_list': 'src_list', 'dst_list': 'dst_list'}   # list tags: only with --allowlist/--blocklist
+ALERT_DEDUP_KEYS = ['src', 'dst', 'service']
 NUMERIC_FEATURES = [
     'duration','src_bytes','dst_bytes','wrong_fragment','urgent','hot',
     'num_failed_logins','num_compromised','root_shell','su_attempted',
@@ -29,15 +62,92 @@ NUMERIC_FEATURES = [
     'dst_host_srv_rerror_rate'
 ]
 CATEGORICAL_BASE = ['protocol_type', 'service', 'flag']
+# conn.log columns kept by read_zeek_conn (features + alert/triage metadata) and their in-memory types
+CONN_COLUMNS = ['ts', 'id.orig_h', 'id.resp_h', 'proto', 'service', 'duration',
+                'orig_bytes', 'resp_bytes', 'conn_state']
+CONN_FLOAT_COLUMNS = ['ts', 'duration']
+CONN_COUNTER_COLUMNS = ['orig_bytes', 'resp_bytes', 'orig_pkts', 'resp_pkts', 'orig_ip_bytes', 'resp_ip_bytes']
+CONN_CATEGORY_COLUMNS = ['id.orig_h', 'id.resp_h', 'proto', 'service', 'conn_state']
+READ_CHUNK_ROWS = 200000
+ATTACK_TYPE_NAMES = {0: 'Normal', 1: 'DoS', 2: 'Probe', 3: 'R2L', 4: 'U2R'}
+HIGH_CONFIDENCE = 0.8        # summary buckets, as reported by /api/analysis/predict
+MEDIUM_CONFIDENCE = 0.6
+# inference dedup: optional log2 buckets for continuous features (rows in one bucket share a verdict)
+QUANTIZE_COLUMNS = ['duration', 'src_bytes', 'dst_bytes']
+QUANTIZE_STEPS_PER_OCTAVE = 8
+VERDICT_CACHE_SIZE = 200000  # max feature vectors remembered across runs (--verdict_cache)
+# load shedding (--row_budget / --time_budget): priority rows are scored in full while
+# they fit, the remaining bulk is stratified by (service, proto, conn_state) and sampled
+SHED_ERROR_STATES = ['REJ', 'S0', 'RSTOS0', 'RSTRH', 'SH', 'SHR', 'OTH']
+SHED_RARE_SERVICE_FRACTION = 0.01   # services below this share of rows count as rare (priority)
+SHED_STRATA = ['service', 'proto', 'conn_state']
+SHED_MIN_BULK_SHARE = 0.2           # share of the budget kept for bulk rows when priority rows overflow it
+SHED_MIN_TIME_ROWS = 1000           # floor on the row budget derived from --time_budget
+SHED_CALIBRATION_ROWS = 2000        # rows timed to turn --time_budget into a row budget
+SHED_TIME_SAFETY = 0.5              # share of the remaining time spent on inference (rest: write/alerts/store)
+SHED_Z = 1.96                       # 95% bounds on estimated counts
+# --follow mode
+FOLLOW_BATCH_ROWS = 50000     # max records per micro-batch
+FOLLOW_POLL_SECONDS = 1.0     # sleep between polls when no new complete lines are available
+FOLLOW_STATE_VERSION = 1
 # ----------------------------
 
-def read_zeek_conn(path):
+def _typed_conn_chunk(rows, columns):
+    """Convert a chunk of raw string rows to compact dtypes (floats, counters, categoricals)"""
+    chunk = pd.DataFrame(rows, columns=columns)
+    for col in columns:
+        if col in CONN_FLOAT_COLUMNS or col in CONN_COUNTER_COLUMNS:
+            vals = pd.to_numeric(chunk[col].replace('-', np.nan), errors='coerce')
+            # missing duration/counters count as 0; a missing ts stays NaN
+            chunk[col] = vals if col == 'ts' else vals.fillna(0)
+        elif col in CONN_CATEGORY_COLUMNS:
+            chunk[col] = chunk[col].astype('category')
+    return chunk
+
+def _concat_conn_chunks(chunks, columns):
+    """Concatenate typed chunks, unifying categoricals and narrowing counters"""
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+    data = {}
+    for col in columns:
+        parts = [c[col] for c in chunks]
+        if isinstance(parts[0].dtype, pd.CategoricalDtype):
+            data[col] = pd.Series(pd.api.types.union_categoricals(parts))
+        else:
+            data[col] = pd.concat(parts, ignore_index=True)
+        if col in CONN_COUNTER_COLUMNS:
+            data[col] = pd.to_numeric(data[col], downcast='unsigned')
+    return pd.DataFrame(data)
+
+def _conn_projection(fields, columns):
+    """For a '#fields' header return (kept column names, row -> tuple of kept values)"""
+    keep = [c for c in fields if columns is None or c in columns]
+    idx = [fields.index(c) for c in keep]
+    # itemgetter with a single index returns a scalar, not a tuple
+    pick = itemgetter(*idx) if len(idx) > 1 else (lambda p, idx=idx: tuple(p[i] for i in idx))
+    return keep, pick
+
+def _split_conn_line(ln, n_fields):
+    parts = ln.rstrip('\n').split('\t')
+    if len(parts) < n_fields:
+        # tolerate short lines by padding (long lines are truncated by the projection)
+        parts += [''] * (n_fields - len(parts))
+    return parts
+
+def read_zeek_conn(path, columns=CONN_COLUMNS):
     """
     Read Zeek conn.* log and return DataFrame.
     Handles header lines and '#fields' declaration.
+    Only `columns` are kept (None keeps every field); ts/duration are floats,
+    byte/packet counters narrow unsigned ints and repeated strings
+    (addresses, proto, service, conn_state) categoricals. Rows are converted
+    in chunks of READ_CHUNK_ROWS so raw strings never exist for the whole log.
     """
     fields = None
+    keep = None
+    pick = None
     rows = []
+    chunks = []
     with open(path, 'r', encoding='utf-8', errors='replace') as f:
         for ln in f:
             if ln.startswith('#fields'):
@@ -45,27 +155,24 @@ def read_zeek_conn(path):
                 parts = ln.strip().split('\t')
                 # first token is '#fields'
                 fields = parts[1:]
+                new_keep, pick = _conn_projection(fields, columns)
+                if keep is not None and new_keep != keep:
+                    raise ValueError("Inconsistent '#fields' headers in conn log")
+                keep = new_keep
                 continue
             if ln.startswith('#'):
                 continue
             if not fields:
                 continue
-            parts = ln.rstrip('\n').split('\t')
-            if len(parts) != len(fields):
-                # tolerate mismatched lines by padding/truncating
-                if len(parts) < len(fields):
-                    parts += [''] * (len(fields) - len(parts))
-                else:
-                    parts = parts[:len(fields)]
-            rows.append(parts)
+            rows.append(pick(_split_conn_line(ln, len(fields))))
+            if len(rows) >= READ_CHUNK_ROWS:
+                chunks.append(_typed_conn_chunk(rows, keep))
+                rows = []
     if not fields:
         raise ValueError("No '#fields' header found in conn log")
-    df = pd.DataFrame(rows, columns=fields)
-    # Try to coerce numeric columns where possible
-    for col in ['duration','orig_bytes','resp_bytes','orig_pkts','resp_pkts','orig_ip_bytes','resp_ip_bytes']:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col].replace('-', np.nan), errors='coerce').fillna(0)
-    return df
+    if rows:
+        chunks.append(_typed_conn_chunk(rows, keep))
+    return _concat_conn_chunks(chunks, keep)
 
 def build_feature_dataframe(conn_df):
     """
@@ -79,9 +186,9 @@ def build_feature_dataframe(conn_df):
         feat['duration'] = conn_df['duration'].astype(float)
     else:
         feat['duration'] = 0.0
-    # bytes
-    feat['src_bytes'] = conn_df['orig_bytes'] if 'orig_bytes' in conn_df.columns else 0
-    feat['dst_bytes'] = conn_df['resp_bytes'] if 'resp_bytes' in conn_df.columns else 0
+    # bytes (counters are stored as narrow ints; the model was fit on floats)
+    feat['src_bytes'] = conn_df['orig_bytes'].astype(float) if 'orig_bytes' in conn_df.columns else 0
+    feat['dst_bytes'] = conn_df['resp_bytes'].astype(float) if 'resp_bytes' in conn_df.columns else 0
 
     # fill any other numeric features with zeros
     for n in NUMERIC_FEATURES:
@@ -140,20 +247,1063 @@ def align_features_with_model(X, model):
     # last fallback: return X as-is
     return X
 
+class VerdictCache:
+    """
+    Bounded LRU of (predicted_class, confidence) per feature vector, persisted
+    with joblib so consecutive scorer.py runs share it. Entries are keyed by a
+    digest of the (optionally quantized) aligned feature row; the cache is
+    discarded when the model file, feature columns or quantization change.
+    """
+    def __init__(self, path, model_path, columns, quantize, max_entries=VERDICT_CACHE_SIZE):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        st = Path(model_path).stat()
+        col_digest = hashlib.blake2b('\x1f'.join(map(str, columns)).encode(), digest_size=16).hexdigest()
+        self.signature = (str(Path(model_path).resolve()), st.st_size, st.st_mtime_ns, col_digest, bool(quantize))
+        self.entries = OrderedDict()
+        self.hits = 0
+        if self.path.exists():
+            try:
+                saved = joblib.load(str(self.path))
+                if saved.get('signature') == self.signature:
+                    self.entries = saved['entries']
+            except Exception:
+                self.entries = OrderedDict()
+
+    def get(self, key):
+        v = self.entries.get(key)
+        if v is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return v
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def save(self):
+        # write-then-rename so concurrent runs never see a torn file
+        tmp = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        joblib.dump({'signature': self.signature, 'entries': self.entries}, str(tmp))
+        os.replace(tmp, self.path)
+
+def quantize_features(X, columns=QUANTIZE_COLUMNS, steps=QUANTIZE_STEPS_PER_OCTAVE):
+    """Replace continuous columns with log2 bucket ids (1/steps octave wide); used only for dedup keys"""
+    Xq = X.copy()
+    for col in columns:
+        if col in Xq.columns:
+            v = np.clip(Xq[col].to_numpy(dtype=float), 0, None)
+            Xq[col] = np.floor(np.log2(1.0 + v) * steps)
+    return Xq
+
+def predict_deduplicated(model, Xp, quantize=False, cache=None, skip=None):
+    """
+    Run the model once per distinct feature vector and scatter the verdicts back.
+    Constant columns are ignored when grouping; with quantize, rows whose
+    continuous features fall in the same log2 bucket count as one vector and
+    take the verdict of the first such row. cache (VerdictCache) short-circuits
+    vectors seen in earlier runs. Rows flagged in skip (allowlisted) never
+    reach the model: class 0 with confidence NaN.
+    Returns (preds, confidences, stats).
+    """
+    if skip is not None and np.any(skip):
+        skip = np.asarray(skip, dtype=bool)
+        sub_preds, sub_conf, stats = predict_deduplicated(model, Xp[~skip], quantize=quantize, cache=cache)
+        preds = np.zeros(len(Xp), dtype=np.asarray(sub_preds).dtype)
+        confidences = np.full(len(Xp), np.nan)
+        preds[~skip] = sub_preds
+        confidences[~skip] = sub_conf
+        stats = dict(stats, rows=int(len(Xp)), skipped_allowlisted=int(skip.sum()))
+        return preds, confidences, stats
+    n = len(Xp)
+    keys = quantize_features(Xp) if quantize else Xp
+    varying = [c for c in keys.columns if n and not (keys[c] == keys[c].iloc[0]).all()]
+    if varying and n:
+        inverse = keys.groupby(varying, sort=False, dropna=False).ngroup().to_numpy()
+    else:
+        inverse = np.zeros(n, dtype=np.int64)
+    n_unique = int(inverse.max()) + 1 if n else 0
+    # first row of each group is its representative
+    first = np.full(n_unique, n, dtype=np.int64)
+    np.minimum.at(first, inverse, np.arange(n))
+
+    u_preds = np.empty(n_unique, dtype=object)
+    u_conf = np.zeros(n_unique, dtype=float)
+    todo = np.arange(n_unique)
+    digests = None
+    if cache is not None and n_unique:
+        key_rows = np.ascontiguousarray(keys.iloc[first].to_numpy(dtype=float))
+        digests = [hashlib.blake2b(r.tobytes(), digest_size=16).digest() for r in key_rows]
+        missing = []
+        for u, d in enumerate(digests):
+            v = cache.get(d)
+            if v is None:
+                missing.append(u)
+            else:
+                u_preds[u], u_conf[u] = v
+        todo = np.asarray(missing, dtype=np.int64)
+
+    if len(todo):
+        Xu = Xp.iloc[first[todo]]
+        # use predict_proba if available
+        if hasattr(model, 'predict_proba'):
+            probs = model.predict_proba(Xu)
+            # choose class with max prob and max prob as confidence
+            idx = np.argmax(probs, axis=1)
+            p = model.classes_[idx] if hasattr(model, 'classes_') else model.predict(Xu)
+            c = probs[np.arange(len(idx)), idx]
+        else:
+            p = model.predict(Xu)
+            # no proba: confidence based on trees (if forest has predict_proba through wrapper)
+            c = np.full(len(p), 0.0)
+        u_preds[todo] = p
+        u_conf[todo] = c
+        if cache is not None:
+            for u, pv, cv in zip(todo, p, c):
+                cache.put(digests[u], (pv.item() if hasattr(pv, 'item') else pv, float(cv)))
+
+    # restore a numeric dtype for class labels when the model uses one
+    u_preds = pd.Series(u_preds).infer_objects().to_numpy()
+    stats = {
+        'rows': int(n),
+        'unique_vectors': n_unique,
+        'cache_hits': int(n_unique - len(todo)),
+        'model_rows': int(len(todo)),
+        'quantized': bool(quantize),
+    }
+    return u_preds[inverse], u_conf[inverse], stats
+
+def extract_alerts(conn_df, preds, confidences, top_k=ALERT_TOP_K, per_class=ALERT_PER_CLASS_CAP):
+    """
+    Vectorized alert selection: attack predictions (class != 0) with
+    confidence >= ALERT_PROB_THRESHOLD, most confident first. Rows sharing
+    (src, dst, service) collapse into the most confident one with a 'hits'
+    count, then the per-class cap and overall top-K are applied.
+    Returns (alerts_df, n_matching_rows).
+    """
+    preds = np.asarray(preds)
+    confidences = np.asarray(confidences, dtype=float)
+    mask = (preds != 0) & (confidences >= ALERT_PROB_THRESHOLD)
+    meta = {new: conn_df[old].to_numpy()[mask] for old, new in ALERT_META_COLUMNS.items() if old in conn_df.columns}
+    alerts = pd.DataFrame(meta)
+    if 'ts' in alerts.columns:
+        alerts['ts'] = pd.to_numeric(alerts['ts'], errors='coerce')
+    for key in ALERT_DEDUP_KEYS:
+        if key not in alerts.columns:
+            alerts[key] = None
+    alerts['predicted_class'] = preds[mask]
+    alerts['confidence'] = confidences[mask]
+    n_matching = int(len(alerts))
+    alerts = alerts.sort_values('confidence', ascending=False, kind='stable')
+    hits = alerts.groupby(ALERT_DEDUP_KEYS, dropna=False, sort=False)['confidence'].transform('size')
+    alerts = alerts.assign(hits=hits).drop_duplicates(ALERT_DEDUP_KEYS, keep='first')
+    if per_class:
+        alerts = alerts[alerts.groupby('predicted_class', sort=False).cumcount() < per_class]
+    if top_k:
+        alerts = alerts.head(top_k)
+    return alerts.reset_index(drop=True), n_matching
+
+class ConnLogFollower:
+    """
+    Tails a growing Zeek TSV conn.log. Only complete lines are consumed; the
+    byte offset, inode and current '#fields' header are exposed through
+    state()/restore so a restart resumes without rescanning. When Zeek
+    rotates the log (path now points at a new inode) or truncates it, the
+    old handle is drained and the new file is read from the start.
+    """
+    def __init__(self, path, columns=CONN_COLUMNS, state=None):
+        self.path = Path(path)
+        self.columns = columns
+        self.f = None
+        self.inode = None
+        self.offset = 0
+        self.fields = None
+        self.keep = None
+        self.pick = None
+        self.rotations = 0
+        if state and state.get('path') == str(self.path):
+            self.inode = state.get('inode')
+            self.offset = int(state.get('offset', 0))
+            self.rotations = int(state.get('rotations', 0))
+            if state.get('fields'):
+                self._set_fields(state['fields'])
+
+    def state(self):
+        return {'path': str(self.path), 'inode': self.inode, 'offset': self.offset,
+                'fields': self.fields, 'rotations': self.rotations}
+
+    def _set_fields(self, fields):
+        self.fields = fields
+        self.keep, self.pick = _conn_projection(fields, self.columns)
+
+    def _open(self):
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return False
+        st = os.fstat(f.fileno())
+        if self.inode is not None and st.st_ino != self.inode:
+            # rotated while we were not running: finish the renamed file first
+            rotated = self._find_rotated()
+            if rotated is not None:
+                f.close()
+                f = open(rotated, 'rb')
+                f.seek(self.offset)
+                self.f = f
+                return True
+        if st.st_ino == self.inode and st.st_size >= self.offset:
+            f.seek(self.offset)
+        else:
+            # different file (or truncated): start over, header comes from the new file
+            self.offset = 0
+            self.fields = self.keep = self.pick = None
+        self.inode = st.st_ino
+        self.f = f
+        return True
+
+    def _find_rotated(self):
+        """Path of the file in the log directory that still has our inode (Zeek renames on rotation)"""
+        try:
+            for entry in os.scandir(self.path.parent):
+                if entry.is_file() and entry.inode() == self.inode and entry.stat().st_size >= self.offset:
+                    return entry.path
+        except OSError:
+            pass
+        return None
+
+    def _rotated(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            # mid-rotation: keep the old handle until the new file appears
+            return False
+        return st.st_ino != self.inode or st.st_size < self.offset
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+    def read_batch(self, max_rows=FOLLOW_BATCH_ROWS):
+        """
+        Return (columns, rows) for up to max_rows new complete records. A batch
+        never mixes records from headers with different column layouts.
+        """
+        if self.f is None and not self._open():
+            return self.keep, []
+        rows = []
+        keep = self.keep
+        while len(rows) < max_rows:
+            line = self.f.readline()
+            if not line:
+                if self._rotated():
+                    # old file is drained: forget it so _open() starts the new one from 0
+                    self.close()
+                    self.inode = None
+                    self.rotations += 1
+                    if rows or not self._open():
+                        break
+                    continue
+                break
+            if not line.endswith(b'\n'):
+                # line still being written: rewind and pick it up on the next poll
+                self.f.seek(self.offset)
+                break
+            ln = line.decode('utf-8', errors='replace')
+            if ln.startswith('#fields'):
+                fields = ln.strip().split('\t')[1:]
+                new_keep, _ = _conn_projection(fields, self.columns)
+                if rows and new_keep != keep:
+                    # layout changes: finish this batch first, re-read the header next time
+                    self.f.seek(self.offset)
+                    break
+                self._set_fields(fields)
+                keep = self.keep
+            elif not ln.startswith('#') and self.fields:
+                rows.append(self.pick(_split_conn_line(ln, len(self.fields))))
+            self.offset += len(line)
+        return keep, rows
+
+def _write_json_atomic(path, obj):
+    tmp = Path(f'{path}.{os.getpid()}.tmp')
+    tmp.write_text(json.dumps(obj), encoding='utf-8')
+    os.replace(tmp, path)
+
+def run_follow(args):
+    """
+    --follow: tail args.zeek_conn and score appended records in micro-batches.
+    Each batch appends (ts, src, dst, service, proto, conn_state,
+    predicted_class, confidence) rows to args.output, appends alerts to the
+    alert stream, rewrites <output>.summary.json with running counters, prints
+    the counters as one JSON line and then checkpoints the follower state to
+    --follow_state (default <output>.follow.json). Runs until SIGINT/SIGTERM
+    or --max_idle seconds without new records.
+    """
+    out_path = Path(args.output)
+    alerts_path = Path(args.alerts_output) if args.alerts_output else out_path.with_name(out_path.stem + '_alerts.jsonl')
+    summary_path = out_path.with_name(out_path.stem + '.summary.json')
+    state_path = Path(args.follow_state) if args.follow_state else out_path.with_name(out_path.stem + '.follow.json')
+
+    if not args.model or not Path(args.model).exists():
+        print(json.dumps({'error': 'follow mode requires --model', 'model': args.model}))
+        sys.exit(2)
+    model_path = Path(args.model)
+    model = joblib.load(str(model_path))
+    index = reputation_index(args)
+
+    saved = {}
+    if state_path.exists():
+        try:
+            saved = json.loads(state_path.read_text(encoding='utf-8'))
+            if saved.get('version') != FOLLOW_STATE_VERSION:
+                saved = {}
+        except Exception:
+            saved = {}
+    follower = ConnLogFollower(args.zeek_conn, state=saved.get('follower'))
+    summary = saved.get('summary') or {'rows': 0, 'batches': 0, 'class_counts': {}, 'attacks': 0,
+                                        'alerts_written': 0, 'last_ts': None}
+    cache = None
+
+    stop = {'flag': False}
+    def _request_stop(signum, frame):
+        stop['flag'] = True
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    idle_since = time.monotonic()
+    try:
+        while not stop['flag']:
+            keep, rows = follower.read_batch(args.batch_rows)
+            if not rows:
+                if follower.offset != (saved.get('follower') or {}).get('offset'):
+                    # headers/comments advance the offset too; checkpoint them
+                    saved = {'version': FOLLOW_STATE_VERSION, 'follower': follower.state(), 'summary': summary}
+                    _write_json_atomic(state_path, saved)
+                if args.max_idle and time.monotonic() - idle_since >= args.max_idle:
+                    break
+                time.sleep(args.poll_interval)
+                continue
+            idle_since = time.monotonic()
+            t0 = time.perf_counter()
+
+            conn_df = _concat_conn_chunks([_typed_conn_chunk(rows, keep)], keep)
+            Xp = align_features_with_model(build_feature_dataframe(conn_df), model)
+            skip = None
+            if index:
+                conn_df = enrich_reputation(conn_df, index)
+                skip = list_masks(conn_df)[0] if args.skip_allowlisted else None
+            if cache is None and args.verdict_cache:
+                try:
+                    cache = VerdictCache(args.verdict_cache, model_path, list(Xp.columns), args.quantize)
+                except Exception:
+                    cache = None
+            preds, confidences, _ = predict_deduplicated(model, Xp, quantize=args.quantize, cache=cache, skip=skip)
+
+            out_df = pd.DataFrame({new: conn_df[old].to_numpy() for old, new in ALERT_META_COLUMNS.items()
+                                   if old in conn_df.columns})
+            out_df['predicted_class'] = preds
+            out_df['confidence'] = confidences
+            write_header = not out_path.exists() or out_path.stat().st_size == 0
+            out_df.to_csv(out_path, mode='a', header=write_header, index=False)
+
+            if args.time_rollups_dir:
+                append_time_rollups(args.time_rollups_dir, _conn_ts(conn_df), preds, confidences)
+
+            alerts, _ = extract_alerts(conn_df, preds, confidences,
+                                       top_k=args.alerts_top_k, per_class=args.alerts_per_class)
+            if len(alerts):
+                with open(alerts_path, 'a', encoding='utf-8') as f:
+                    f.write(alerts.to_json(orient='records', lines=True).rstrip('\n') + '\n')
+
+            counts = pd.Series(preds).value_counts()
+            for cls, n in counts.items():
+                key = str(cls)
+                summary['class_counts'][key] = summary['class_counts'].get(key, 0) + int(n)
+            summary['rows'] += int(len(preds))
+            summary['batches'] += 1
+            summary['attacks'] += int((np.asarray(preds) != 0).sum())
+            summary['alerts_written'] += int(len(alerts))
+            if 'ts' in conn_df.columns and conn_df['ts'].notna().any():
+                summary['last_ts'] = float(conn_df['ts'].max())
+            summary['batch_rows'] = int(len(preds))
+            summary['batch_seconds'] = time.perf_counter() - t0
+            summary['updated'] = time.time()
+            summary['offset'] = follower.offset
+            summary['rotations'] = follower.rotations
+            _write_json_atomic(summary_path, summary)
+            print(json.dumps(summary), flush=True)
+
+            # checkpoint only after the batch's outputs are on disk (at-least-once on crash)
+            saved = {'version': FOLLOW_STATE_VERSION, 'follower': follower.state(), 'summary': summary}
+            _write_json_atomic(state_path, saved)
+    finally:
+        follower.close()
+        if cache is not None:
+            try:
+                cache.save()
+            except Exception:
+                pass
+    sys.exit(0)
+
+def summarize_predictions(preds, confidences, weights=None):
+    """
+    The statistics /api/analysis/predict reports, from in-memory predictions.
+    Carries confidence_sum/confidence_count so per-file summaries can be merged
+    (merge_summaries); rows without a confidence (skipped allowlisted flows)
+    are left out of the confidence statistics and counted in
+    normal_skipped_allowlisted, so the normal_* buckets add up to normal.
+    With weights (load shedding: rows each sampled row stands for) counts and
+    the confidence mean are weighted estimates, rounded to whole records.
+    """
+    preds = np.asarray(preds)
+    conf = np.asarray(confidences, dtype=float)
+    w = np.ones(len(preds)) if weights is None else np.asarray(weights, dtype=float)
+    normal = preds == 0
+    attack = ~normal
+    def total(mask):
+        return int(round(w[mask].sum()))
+    classes = np.unique(preds[attack])
+    n = w.sum()
+    scored = ~np.isnan(conf)   # allowlisted rows skipped by the model carry no confidence
+    n_scored = w[scored].sum()
+    conf_sum = float((w[scored] * conf[scored]).sum())
+    return {
+        'total_records': int(round(n)),
+        'normal': total(normal),
+        'attacks': total(attack),
+        'high_confidence_alerts': total(attack & (conf > HIGH_CONFIDENCE)),
+        'attack_breakdown': {ATTACK_TYPE_NAMES.get(k, f'Class_{k}'): total(preds == k) for k in classes.tolist()},
+        'avg_confidence': conf_sum / n_scored if n_scored else 0.0,
+        'max_confidence': float(conf[scored].max()) if scored.any() else 0.0,
+        'normal_high_conf': total(normal & (conf > HIGH_CONFIDENCE)),
+        'normal_medium_conf': total(normal & (conf >= MEDIUM_CONFIDENCE) & (conf <= HIGH_CONFIDENCE)),
+        'normal_low_conf': total(normal & (conf < MEDIUM_CONFIDENCE)),
+        'normal_skipped_allowlisted': total(normal & ~scored),
+        'confidence_sum': conf_sum,
+        'confidence_count': float(n_scored),
+    }
+
+def merge_summaries(summaries):
+    """Combine summarize_predictions() outputs as if all rows came from one log"""
+    merged = {k: 0 for k in ('total_records', 'normal', 'attacks', 'high_confidence_alerts',
+                             'normal_high_conf', 'normal_medium_conf', 'normal_low_conf',
+                             'normal_skipped_allowlisted')}
+    merged.update({'attack_breakdown': {}, 'max_confidence': 0.0, 'confidence_sum': 0.0, 'confidence_count': 0.0})
+    for sm in summaries:
+        for k in ('total_records', 'normal', 'attacks', 'high_confidence_alerts',
+                  'normal_high_conf', 'normal_medium_conf', 'normal_low_conf'):
+            merged[k] += sm[k]
+        merged['normal_skipped_allowlisted'] += sm.get('normal_skipped_allowlisted', 0)
+        for name, n in sm['attack_breakdown'].items():
+            merged['attack_breakdown'][name] = merged['attack_breakdown'].get(name, 0) + n
+        if sm['total_records']:
+            merged['max_confidence'] = max(merged['max_confidence'], sm['max_confidence'])
+        merged['confidence_sum'] += sm['confidence_sum']
+        merged['confidence_count'] += sm.get('confidence_count', sm['total_records'])
+    merged['avg_confidence'] = merged['confidence_sum'] / merged['confidence_count'] if merged['confidence_count'] else 0.0
+    return merged
+
+def _rollup(frame, keys, class_names):
+    agg = {'connections': ('connections', 'sum'), 'attacks': ('attacks', 'sum')}
+    agg.update({name: (name, 'sum') for name in class_names})
+    agg.update({
+        'max_attack_confidence': ('attack_confidence', 'max'),
+        'orig_bytes': ('orig_bytes', 'sum'),
+        'resp_bytes': ('resp_bytes', 'sum'),
+        'first_ts': ('ts', 'min'),
+        'last_ts': ('ts', 'max'),
+    })
+    out = frame.groupby(keys, observed=True, sort=False).agg(**agg).reset_index()
+    out['max_attack_confidence'] = out['max_attack_confidence'].fillna(0.0)
+    return out.sort_values(['attacks', 'connections'], ascending=False, kind='stable')
+
+def _source_key(path):
+    """Identity of a scored log for the time-rollup ledger: path, size and mtime"""
+    p = Path(path).resolve()
+    st = p.stat()
+    return f'{p}:{st.st_size}:{st.st_mtime_ns}'
+
+def _conn_ts(conn_df):
+    if 'ts' not in conn_df.columns:
+        return np.full(len(conn_df), np.nan)
+    return pd.to_numeric(conn_df['ts'], errors='coerce').to_numpy(dtype=np.float64)
+
+def build_rollups(conn_df, preds, confidences, weights=None):
+    """
+    Per-host (as src and as dst) and per-service aggregates of one scoring
+    run, in a single vectorized group-by each. Attack counts are split by
+    class name (ATTACK_TYPE_NAMES); max_attack_confidence is 0 for hosts
+    without attack predictions. With weights (load shedding) connection,
+    attack and byte totals are weighted estimates (one decimal, so totals
+    stay consistent with the weighted summary instead of drifting by a
+    rounding per host). Returns {'hosts': df, 'services': df}.
+    """
+    preds = np.asarray(preds)
+    confidences = np.asarray(confidences, dtype=float)
+    n = len(preds)
+    attack = preds != 0
+    w = np.ones(n, dtype=np.int64) if weights is None else np.asarray(weights, dtype=float)
+    frame = pd.DataFrame({
+        'connections': w,
+        'attacks': attack * w,
+        'attack_confidence': np.where(attack, confidences, np.nan),
+    })
+    class_names = []
+    for k in np.unique(preds[attack]).tolist():
+        name = ATTACK_TYPE_NAMES.get(k, f'Class_{k}')
+        frame[name] = (preds == k) * w
+        class_names.append(name)
+    for col in ('orig_bytes', 'resp_bytes', 'ts'):
+        frame[col] = pd.to_numeric(conn_df[col], errors='coerce').to_numpy() if col in conn_df.columns else np.nan
+    if weights is not None:
+        frame['orig_bytes'] *= w
+        frame['resp_bytes'] *= w
+
+    hosts = []
+    for role, col in (('src', 'id.orig_h'), ('dst', 'id.resp_h')):
+        if col not in conn_df.columns:
+            continue
+        per_host = _rollup(frame.assign(host=conn_df[col].to_numpy()), ['host'], class_names)
+        per_host.insert(1, 'role', role)
+        hosts.append(per_host)
+    rollups = {}
+    if hosts:
+        rollups['hosts'] = pd.concat(hosts, ignore_index=True)
+    if 'service' in conn_df.columns:
+        rollups['services'] = _rollup(frame.assign(service=conn_df['service'].to_numpy()), ['service'], class_names)
+    if weights is not None:
+        totals = ['connections', 'attacks', *class_names, 'orig_bytes', 'resp_bytes']
+        for name, df in rollups.items():
+            df[totals] = df[totals].round(1)
+    return rollups
+
+_reputation_indexes = {}
+
+def reputation_index(args):
+    """The --allowlist/--blocklist index (None without lists), built once per process"""
+    if not (getattr(args, 'allowlist', None) or getattr(args, 'blocklist', None)):
+        return None
+    key = (tuple(args.allowlist or ()), tuple(args.blocklist or ()))
+    if key not in _reputation_indexes:
+        _reputation_indexes[key] = load_reputation_index(args.allowlist or (), args.blocklist or (),
+                                                         cache_path=args.reputation_cache)
+    return _reputation_indexes[key]
+
+def enrich_reputation(conn_df, index):
+    """Add src_list/dst_list tags ('allow:<label>', 'block:<label>' or '') to conn_df"""
+    tags = {}
+    for col, name in (('id.orig_h', 'src_list'), ('id.resp_h', 'dst_list')):
+        if col in conn_df.columns:
+            tags[name] = pd.Categorical(tag_hosts(index, conn_df[col]))
+    return conn_df.assign(**tags)
+
+def list_masks(conn_df):
+    """(allowlisted, blocklisted) flows; allowlisted needs no blocklisted endpoint"""
+    allow = np.zeros(len(conn_df), dtype=bool)
+    block = np.zeros(len(conn_df), dtype=bool)
+    for name in ('src_list', 'dst_list'):
+        if name in conn_df.columns:
+            tags = conn_df[name].astype(str)
+            allow |= tags.str.startswith('allow:').to_numpy()
+            block |= tags.str.startswith('block:').to_numpy()
+    return allow & ~block, block
+
+def _allocate(sizes, budget):
+    """
+    Split budget rows over strata in proportion to their sizes: at least one
+    row per stratum, never more than the stratum holds, exactly budget in
+    total (largest remainders get the rows lost to rounding down).
+    """
+    if budget >= sizes.sum():
+        return sizes.copy()
+    share = budget * sizes / sizes.sum()
+    alloc = np.minimum(sizes, np.maximum(1, np.floor(share).astype(np.int64)))
+    # the one-row floors may overshoot: take rows back from the largest allocations
+    for _ in range(int(alloc.sum()) - budget):
+        alloc[np.argmax(alloc)] -= 1
+    spare = budget - int(alloc.sum())
+    if spare > 0:
+        alloc[np.argsort(alloc - share, kind='stable')[:spare]] += 1
+    return alloc
+
+def _stratified_sample(conn_df, rows, budget, rng):
+    """
+    Draw budget of the given rows, stratified by SHED_STRATA (a single
+    stratum when there are more strata than rows to draw). Returns
+    (picked rows, their stratum, stratum sizes, rows drawn per stratum).
+    """
+    keys = [c for c in SHED_STRATA if c in conn_df.columns]
+    if keys and len(rows):
+        stratum = conn_df.iloc[rows].groupby(keys, observed=True, sort=False, dropna=False).ngroup().to_numpy()
+    else:
+        stratum = np.zeros(len(rows), dtype=np.int64)
+    if stratum.max(initial=0) >= budget:
+        stratum = np.zeros(len(rows), dtype=np.int64)
+    sizes = np.bincount(stratum) if len(rows) else np.zeros(0, dtype=np.int64)
+    alloc = _allocate(sizes, budget) if len(rows) else sizes
+    # random rank inside each stratum; keep the first alloc[h] rows of stratum h
+    order = np.lexsort((rng.random(len(rows)), stratum))
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]]) if len(sizes) else sizes
+    rank = np.arange(len(rows)) - starts[stratum[order]]
+    picked = order[rank < alloc[stratum[order]]]
+    return rows[picked], stratum[picked], sizes, alloc
+
+def plan_load_shedding(conn_df, budget, rng):
+    """
+    Pick at most budget rows to score. Priority rows (each source host's
+    first connection in the log, rare services below
+    SHED_RARE_SERVICE_FRACTION of rows, error conn_states) are kept
+    whole while they fit in the budget minus the bulk's reserved
+    SHED_MIN_BULK_SHARE. A spoofed-source flood makes most of a log
+    priority, so past that point the priority rows are themselves
+    stratified and sampled like the bulk. The bulk gets the rest of the
+    budget, allocated to its strata (SHED_STRATA) in proportion to their
+    size, at least one row each, and filled by a uniform random draw
+    inside every stratum.
+    Returns (keep_idx, plan) where plan holds per-kept-row 'weights' and
+    'stratum' (-1 = kept whole) plus 'sizes'/'sampled' per stratum.
+    """
+    n = len(conn_df)
+    priority = np.zeros(n, dtype=bool)
+    if 'id.orig_h' in conn_df.columns:
+        priority |= ~conn_df['id.orig_h'].duplicated().to_numpy()
+    if 'service' in conn_df.columns:
+        share = conn_df['service'].map(conn_df['service'].value_counts(normalize=True))
+        priority |= (share.astype(float) < SHED_RARE_SERVICE_FRACTION).to_numpy()
+    if 'conn_state' in conn_df.columns:
+        priority |= conn_df['conn_state'].isin(SHED_ERROR_STATES).to_numpy()
+    prio = np.flatnonzero(priority)
+    bulk = np.flatnonzero(~priority)
+
+    budget = max(1, min(int(budget), n))
+    bulk_reserve = min(len(bulk), int(budget * SHED_MIN_BULK_SHARE))
+    prio_budget = min(len(prio), budget - bulk_reserve)
+    bulk_budget = min(len(bulk), budget - prio_budget)
+
+    keep, keep_stratum, sizes, alloc = [], [], [], []
+    if prio_budget == len(prio):
+        keep.append(prio)
+        keep_stratum.append(np.full(len(prio), -1))
+    for rows, group_budget in ((prio, prio_budget if prio_budget < len(prio) else 0), (bulk, bulk_budget)):
+        if not group_budget:
+            continue
+        picked, stratum, group_sizes, group_alloc = _stratified_sample(conn_df, rows, group_budget, rng)
+        keep.append(picked)
+        keep_stratum.append(stratum + sum(len(g) for g in sizes))   # strata numbered across both groups
+        sizes.append(group_sizes)
+        alloc.append(group_alloc)
+    keep_idx = np.concatenate(keep) if keep else np.zeros(0, dtype=np.int64)
+    keep_stratum = np.concatenate(keep_stratum) if keep_stratum else np.zeros(0, dtype=np.int64)
+    sizes = np.concatenate(sizes) if sizes else np.zeros(0, dtype=np.int64)
+    alloc = np.concatenate(alloc) if alloc else np.zeros(0, dtype=np.int64)
+
+    order = np.argsort(keep_idx, kind='stable')   # keep log order in the outputs
+    keep_idx, keep_stratum = keep_idx[order], keep_stratum[order]
+    weights = np.ones(len(keep_idx))
+    sampled_rows = keep_stratum >= 0
+    weights[sampled_rows] = sizes[keep_stratum[sampled_rows]] / alloc[keep_stratum[sampled_rows]]
+    return keep_idx, {'weights': weights, 'stratum': keep_stratum, 'sizes': sizes, 'sampled': alloc,
+                      'rows_total': int(n), 'priority_candidates': int(len(prio)),
+                      'priority_rows': int(prio_budget), 'priority_sampled': prio_budget < len(prio)}
+
+def estimate_class_counts(preds, plan):
+    """
+    Per-class count estimates for a load-shed run: priority rows are exact,
+    each stratum contributes N_h * p_h with the finite-population variance
+    N_h^2 (1 - n_h/N_h) p_h (1 - p_h) / (n_h - 1) (p(1-p) taken as 0.25
+    when a stratum has a single sampled row). Bounds are +/- SHED_Z sigma,
+    clipped to what is possible.
+    """
+    preds = np.asarray(preds)
+    stratum, sizes, alloc = plan['stratum'], plan['sizes'], plan['sampled']
+    sampled = stratum >= 0
+    n_h = alloc.astype(float)
+    fpc = 1 - n_h / np.maximum(sizes, 1)
+    estimates = {}
+    for k in np.unique(preds).tolist():
+        exact = int(((preds == k) & ~sampled).sum())
+        hits = np.bincount(stratum[sampled], weights=(preds[sampled] == k), minlength=len(sizes))
+        p = hits / np.maximum(n_h, 1)
+        var_term = np.where(n_h > 1, p * (1 - p) / np.maximum(n_h - 1, 1), 0.25)
+        var = float((sizes.astype(float) ** 2 * fpc * var_term).sum())
+        est = exact + float((sizes * p).sum())
+        margin = SHED_Z * var ** 0.5
+        estimates[ATTACK_TYPE_NAMES.get(k, f'Class_{k}')] = {
+            'estimate': round(est, 1),
+            'ci95_low': round(max(est - margin, exact + float(hits.sum())), 1),
+            'ci95_high': round(min(est + margin, exact + float(sizes.sum())), 1),
+            'exact_rows': exact,
+            'sampled_rows': int(hits.sum()),
+        }
+    return estimates
+
+def rows_within_time(model, X, seconds, rng):
+    """
+    Convert a time budget into a row budget: time inference on a random
+    SHED_CALIBRATION_ROWS sample and keep SHED_TIME_SAFETY of the remaining
+    time for inference. Returns (rows, measured rows/s).
+    """
+    n = min(len(X), SHED_CALIBRATION_ROWS)
+    sample = X.iloc[rng.choice(len(X), size=n, replace=False)]
+    t0 = time.perf_counter()
+    predict_deduplicated(model, align_features_with_model(sample.copy(), model))
+    rate = n / max(time.perf_counter() - t0, 1e-6)
+    return max(0, int(max(seconds, 0) * SHED_TIME_SAFETY * rate)), rate
+
+def shed_rows(conn_df, X, model, args, elapsed, result_obj):
+    """
+    Apply --row_budget / --time_budget (seconds left after the elapsed
+    parse/featurize time, converted by rows_within_time). Logs within the
+    budget are returned untouched with plan None; otherwise the planned
+    subset is returned and result_obj is marked 'sampled'.
+    """
+    rng = np.random.default_rng(args.sample_seed)
+    budget = args.row_budget or None
+    info = {}
+    if args.time_budget:
+        fit, rate = rows_within_time(model, X, args.time_budget - elapsed, rng)
+        fit = max(fit, SHED_MIN_TIME_ROWS)   # an exhausted time budget still scores a minimal sample
+        budget = min(budget, fit) if budget else fit
+        info['calibrated_rows_per_second'] = rate
+    info['row_budget'] = int(budget)
+    if len(X) <= budget:
+        result_obj['sampled'] = False
+        result_obj['sampling'] = info
+        return conn_df, X, None
+    keep_idx, plan = plan_load_shedding(conn_df, budget, rng)
+    info.update({
+        'rows_total': plan['rows_total'],
+        'rows_scored': int(len(keep_idx)),
+        'priority_rows': plan['priority_rows'],
+        'priority_candidates': plan['priority_candidates'],
+        'priority_sampled': plan['priority_sampled'],
+        'sampled_rows': int((plan['stratum'] >= 0).sum()),
+        'strata': int(len(plan['sizes'])),
+    })
+    result_obj['sampled'] = bool(len(keep_idx) < len(X))
+    result_obj['sampling'] = info
+    return (conn_df.iloc[keep_idx].reset_index(drop=True),
+            X.iloc[keep_idx].reset_index(drop=True), plan)
+
+def predict_and_write(conn_df, X, model, model_path, out_path, alerts_path, args, prof, result_obj):
+    """
+    Align X with the model, predict (deduplicated, optionally cached), write
+    the predictions CSV and the alert stream, and record results in result_obj.
+    Under --row_budget/--time_budget only the rows chosen by
+    plan_load_shedding() are scored; the CSV gets a 'weight' column and the
+    result is marked sampled with per-class estimates.
+    """
+    timings = prof.timings
+    index = reputation_index(args)
+    if index:
+        with prof.stage('enrich'):
+            conn_df = enrich_reputation(conn_df, index)
+    plan = None
+    if getattr(args, 'row_budget', None) or getattr(args, 'time_budget', None):
+        with prof.stage('shed'):
+            conn_df, X, plan = shed_rows(conn_df, X, model, args, sum(timings.values()), result_obj)
+    weights = plan['weights'] if plan is not None else None
+    with prof.stage('align'):
+        Xp = align_features_with_model(X.copy(), model)
+    cache = None
+    if args.verdict_cache:
+        try:
+            cache = VerdictCache(args.verdict_cache, model_path, list(Xp.columns), args.quantize)
+        except Exception as e:
+            result_obj['verdict_cache_error'] = f'failed to open verdict cache: {e}'
+    skip = None
+    if index:
+        allowed, blocked = list_masks(conn_df)
+        result_obj['reputation'] = {
+            'allowlisted_rows': int(allowed.sum()),
+            'blocklisted_rows': int(blocked.sum()),
+            'skipped_inference': bool(args.skip_allowlisted),
+        }
+        skip = allowed if args.skip_allowlisted else None
+    with prof.stage('predict'):
+        preds, confidences, result_obj['inference'] = predict_deduplicated(
+            model, Xp, quantize=args.quantize, cache=cache, skip=skip)
+    if cache is not None:
+        try:
+            cache.save()
+        except Exception as e:
+            result_obj['verdict_cache_error'] = f'failed to save verdict cache: {e}'
+    if timings['predict'] > 0:
+        result_obj['rows_per_second'] = float(len(Xp) / timings['predict'])
+
+    # attach to CSV
+    with prof.stage('write'):
+        out_df = X.copy()
+        out_df['predicted_class'] = preds
+        out_df['confidence'] = confidences
+        for name in ('src_list', 'dst_list'):
+            if name in conn_df.columns:
+                out_df[name] = conn_df[name].to_numpy()
+        if weights is not None:
+            out_df['weight'] = weights
+        out_df.to_csv(out_path, index=False)
+
+    result_obj['predictions'] = str(out_path)
+    result_obj['pred_count'] = int(len(out_df))
+    result_obj['summary'] = summarize_predictions(preds, confidences, weights)
+    if plan is not None:
+        result_obj['estimates'] = estimate_class_counts(preds, plan)
+
+    with prof.stage('alerts'):
+        alerts, n_matching = extract_alerts(conn_df, preds, confidences,
+                                            top_k=args.alerts_top_k, per_class=args.alerts_per_class)
+        alerts.to_json(alerts_path, orient='records', lines=True)
+    result_obj['alerts_file'] = str(alerts_path)
+    result_obj['alerts_matching'] = n_matching
+    result_obj['alerts_written'] = int(len(alerts))
+
+    with prof.stage('rollups'):
+        rollups = build_rollups(conn_df, preds, confidences, weights)
+    if 'hosts' in rollups:
+        top = rollups['hosts']
+        top = top[(top['role'] == 'src') & (top['attacks'] > 0)].head(10)
+        result_obj['top_attack_sources'] = json.loads(top.to_json(orient='records'))
+    with prof.stage('store'):
+        result_obj['prediction_store'] = str(write_prediction_store(
+            conn_df, preds, confidences, store_path_for(out_path), rollups=rollups, weights=weights))
+    if args.time_rollups_dir:
+        with prof.stage('time_rollups'):
+            result_obj['time_rollups'] = append_time_rollups(
+                args.time_rollups_dir, _conn_ts(conn_df), preds, confidences, weights=weights,
+                source=_source_key(result_obj.get('zeek_conn') or args.zeek_conn))
+    return result_obj
+
+def expand_conn_inputs(specs):
+    """
+    Resolve --zeek_conn values: glob patterns are expanded, directories
+    (given or matched, e.g. 'results/zeek_*') are searched recursively for
+    conn*.log, plain paths pass through.
+    Returns (paths, is_batch); is_batch is False only for a single plain path.
+    """
+    paths = []
+    is_batch = len(specs) > 1
+    for spec in specs:
+        if glob.has_magic(spec) and not Path(spec).exists():
+            matches = [Path(m) for m in sorted(glob.glob(spec, recursive=True))]
+            is_batch = True
+        else:
+            matches = [Path(spec)]
+        for p in matches:
+            if p.is_dir():
+                paths.extend(sorted(p.rglob('conn*.log')))
+                is_batch = True
+            else:
+                paths.append(p)
+    seen = set()
+    unique = []
+    for p in paths:
+        key = str(p.resolve())
+        if key not in seen and p.is_file():
+            seen.add(key)
+            unique.append(p)
+        elif key not in seen and not is_batch:
+            unique.append(p)
+    return unique, is_batch
+
+def batch_output_names(paths):
+    """
+    Output name per log for batch mode: its path relative to the logs'
+    common directory joined with '__' (the parent directory name is kept
+    when all logs share one directory), e.g. a/zeek_1/conn.log and
+    b/zeek_1/conn.log -> a__zeek_1__conn, b__zeek_1__conn. Any remaining
+    clash gets a numeric suffix, so no log overwrites another's output.
+    """
+    resolved = [Path(p).resolve() for p in paths]
+    root = Path(os.path.commonpath([str(p.parent) for p in resolved])) if resolved else None
+    names, taken = [], set()
+    for p in resolved:
+        parts = list(p.relative_to(root).parts)
+        if len(parts) == 1 and p.parent.name:
+            parts.insert(0, p.parent.name)
+        parts[-1] = Path(parts[-1]).stem
+        name = base = '__'.join(parts)
+        n = 1
+        while name in taken:
+            n += 1
+            name = f'{base}__{n}'
+        taken.add(name)
+        names.append(name)
+    return names
+
+# per-worker model for batch scoring (loaded once by _init_batch_worker)
+_worker_model = None
+
+def _init_batch_worker(model_path):
+    global _worker_model
+    _worker_model = joblib.load(str(model_path)) if model_path else None
+
+def _score_one_file(zeek_path, out_path, alerts_path, args):
+    """Batch worker: score one conn log with the worker's model; never raises"""
+    prof = StageProfiler()
+    result_obj = {'zeek_conn': str(zeek_path), 'output_csv': str(out_path), 'timings': prof.timings}
+    try:
+        with prof.stage('parse'):
+            conn_df = read_zeek_conn(str(zeek_path))
+        with prof.stage('featurize'):
+            X = build_feature_dataframe(conn_df)
+        result_obj['n_records'] = int(len(X))
+        if _worker_model is None:
+            with prof.stage('write'):
+                X.to_csv(out_path, index=False)
+        else:
+            predict_and_write(conn_df, X, _worker_model, args.model, out_path, alerts_path, args, prof, result_obj)
+    except Exception as e:
+        result_obj['error'] = f'{type(e).__name__}: {e}'
+    return result_obj
+
+def run_batch(args, paths):
+    """
+    Score many conn logs across a process pool (model loaded once per worker).
+    Writes <output_dir>/<name>.csv (+ _alerts.jsonl) per log (batch_output_names) and a
+    merged summary JSON; prints the merged summary.
+    """
+    out_dir = Path(args.output_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    summary_path = Path(args.summary_output) if args.summary_output else out_dir / 'summary.json'
+    if args.model and not Path(args.model).exists():
+        print(json.dumps({'error': 'model not found', 'model': args.model}))
+        sys.exit(2)
+
+    t0 = time.perf_counter()
+    jobs = max(1, min(args.jobs or os.cpu_count() or 1, len(paths)))
+    files = []
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_batch_worker,
+                             initargs=(args.model,)) as pool:
+        futures = []
+        for p, name in zip(paths, batch_output_names(paths)):
+            futures.append(pool.submit(_score_one_file, p, out_dir / f'{name}.csv',
+                                       out_dir / f'{name}_alerts.jsonl', args))
+        for fut in as_completed(futures):
+            files.append(fut.result())
+    files.sort(key=lambda r: r['zeek_conn'])
+
+    scored = [r['summary'] for r in files if 'summary' in r]
+    result_obj = {
+        'n_files': len(files),
+        'failed': [r['zeek_conn'] for r in files if 'error' in r],
+        'output_dir': str(out_dir),
+        'summary_file': str(summary_path),
+        'summary': merge_summaries(scored) if scored else None,
+        'n_records': int(sum(r.get('n_records', 0) for r in files)),
+        'jobs': jobs,
+        'wall_seconds': time.perf_counter() - t0,
+        'files': files,
+    }
+    _write_json_atomic(summary_path, result_obj)
+    print(json.dumps({k: v for k, v in result_obj.items() if k != 'files'}))
+    sys.exit(0 if not result_obj['failed'] else 1)
+
+class StageProfiler:
+    """
+    Collects per-stage wall-clock timings. With profile=True each stage is
+    additionally run under cProfile and tracemalloc, and write_report() dumps
+    the per-stage call stats and top allocation sites to a text file.
+    """
+    def __init__(self, profile=False, top_n=25):
+        self.timings = {}
+        self.profile = profile
+        self.top_n = top_n
+        self.sections = []
+        if profile:
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        prof = None
+        before = None
+        if self.profile:
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+            prof = cProfile.Profile()
+            prof.enable()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            # stages may run more than once (e.g. 'write'); accumulate
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+            if prof is not None:
+                prof.disable()
+                current, peak = tracemalloc.get_traced_memory()
+                after = tracemalloc.take_snapshot()
+                self.sections.append((name, elapsed, current, peak, prof, after.compare_to(before, 'lineno')))
+
+    def write_report(self, path):
+        buf = io.StringIO()
+        for name, elapsed, current, peak, prof, alloc_diff in self.sections:
+            buf.write(f"==== stage: {name} ====\n")
+            buf.write(f"wall_seconds: {elapsed:.6f}\n")
+            buf.write(f"traced_memory_current_bytes: {current}\n")
+            buf.write(f"traced_memory_peak_bytes: {peak}\n\n")
+            buf.write(f"-- top {self.top_n} allocation deltas --\n")
+            for stat in alloc_diff[:self.top_n]:
+                buf.write(f"{stat}\n")
+            buf.write(f"\n-- top {self.top_n} functions by cumulative time --\n")
+            pstats.Stats(prof, stream=buf).sort_stats('cumulative').print_stats(self.top_n)
+            buf.write("\n")
+        Path(path).write_text(buf.getvalue(), encoding='utf-8')
+        return str(path)
+
 def main():
     parser = argparse.ArgumentParser(description='Score Zeek conn log with ML model')
-    parser.add_argument('--zeek_conn', required=True, help='Path to Zeek conn log (can be conn.log or conn_*.log)')
+    parser.add_argument('--zeek_conn', required=True, nargs='+', help='Zeek conn log path(s); globs and directories (searched for conn*.log) score in batch mode')
     parser.add_argument('--model', required=False, help='Path to joblib model (optional)')
     parser.add_argument('--output', required=False, help='Output CSV path (default: predictions.csv)', default='predictions.csv')
+    parser.add_argument('--alerts_output', required=False, help='Alert stream JSONL path (default: <output>_alerts.jsonl)')
+    parser.add_argument('--alerts_top_k', type=int, default=ALERT_TOP_K, help='Max alerts written, most confident first (0 = unlimited)')
+    parser.add_argument('--alerts_per_class', type=int, default=ALERT_PER_CLASS_CAP, help='Max alerts per predicted class (0 = unlimited)')
+    parser.add_argument('--quantize', action='store_true', help='Bucket duration/bytes on a log2 scale so near-identical rows share one model call')
+    parser.add_argument('--verdict_cache', required=False, help='Path of a persistent LRU verdict cache shared across runs (optional)')
+    parser.add_argument('--profile', action='store_true', help='Write a per-stage cProfile/tracemalloc report next to the output (<output>.profile.txt)')
+    parser.add_argument('--row_budget', type=int, default=0, help='Load shedding: score at most ~N rows (priority rows always, stratified sample of the rest)')
+    parser.add_argument('--time_budget', type=float, default=0, help='Load shedding: fit inference into this many seconds of the run')
+    parser.add_argument('--sample_seed', type=int, default=None, help='Seed for the load-shedding sample (default: random)')
+    parser.add_argument('--allowlist', action='append', help='CIDR allowlist file (repeatable); matches are tagged on predictions and alerts')
+    parser.add_argument('--blocklist', action='append', help='CIDR blocklist file (repeatable); wins over the allowlist')
+    parser.add_argument('--skip_allowlisted', action='store_true', help='Do not run the model on allowlisted flows (class 0, empty confidence)')
+    parser.add_argument('--reputation_cache', required=False, help='Where to keep the compiled allow/blocklist index between runs')
+    parser.add_argument('--time_rollups_dir', required=False, help='Append per-second/per-minute class x confidence counts to the logs in this directory')
+    parser.add_argument('--output_dir', default='batch_predictions', help='Batch mode: directory for per-file outputs')
+    parser.add_argument('--summary_output', required=False, help='Batch mode: merged summary JSON (default: <output_dir>/summary.json)')
+    parser.add_argument('--jobs', type=int, default=0, help='Batch mode: worker processes (default: CPU count)')
+    parser.add_argument('--follow', action='store_true', help='Tail a live conn.log and score appended records continuously (requires --model)')
+    parser.add_argument('--follow_state', required=False, help='Checkpoint file for --follow (default: <output>.follow.json)')
+    parser.add_argument('--batch_rows', type=int, default=FOLLOW_BATCH_ROWS, help='Max records per --follow micro-batch')
+    parser.add_argument('--poll_interval', type=float, default=FOLLOW_POLL_SECONDS, help='Seconds between polls in --follow mode')
+    parser.add_argument('--max_idle', type=float, default=0, help='Exit --follow after this many seconds without new records (0 = never)')
     args = parser.parse_args()
 
-    zeek_path = Path(args.zeek_conn)
+    paths, is_batch = expand_conn_inputs(args.zeek_conn)
+    if args.follow:
+        args.zeek_conn = str(paths[0]) if paths else args.zeek_conn[0]
+        run_follow(args)
+    if is_batch:
+        if not paths:
+            print(json.dumps({'error': 'no conn logs matched', 'inputs': args.zeek_conn}))
+            sys.exit(2)
+        run_batch(args, paths)
+
+    zeek_path = paths[0]
+    args.zeek_conn = str(zeek_path)
     if not zeek_path.exists():
         print(json.dumps({'error':'zeek_conn not found','path':str(zeek_path)}))
         sys.exit(2)
 
+    # per-stage wall-clock timings (seconds), reported under 'timings'
+    prof = StageProfiler(profile=args.profile)
+    timings = prof.timings
+
     try:
-        conn_df = read_zeek_conn(str(zeek_path))
+        with prof.stage('parse'):
+            conn_df = read_zeek_conn(str(zeek_path))
     except Exception as e:
         print(json.dumps({'error':'failed_to_read_conn', 'message': str(e)}))
         sys.exit(3)
@@ -161,57 +1311,53 @@ def main():
     # Save raw parsed CSV first
     out_path = Path(args.output)
     # build features
-    X = build_feature_dataframe(conn_df)
+    with prof.stage('featurize'):
+        X = build_feature_dataframe(conn_df)
 
-    # Save feature CSV (so frontend/backend can inspect)
-    try:
-        X.to_csv(out_path, index=False)
-    except Exception as e:
-        print(json.dumps({'error':'failed_to_write_csv','message':str(e)}))
-        sys.exit(4)
+    # Save feature CSV (so frontend/backend can inspect); with a model the
+    # predictions CSV replaces it, so it is only written when prediction fails
+    def write_features():
+        try:
+            with prof.stage('write'):
+                X.to_csv(out_path, index=False)
+        except Exception as e:
+            print(json.dumps({'error':'failed_to_write_csv','message':str(e)}))
+            sys.exit(4)
 
-    result_obj = {'output_csv': str(out_path), 'n_records': int(len(X))}
+    result_obj = {'output_csv': str(out_path), 'n_records': int(len(X)), 'timings': timings}
+    if not args.model:
+        write_features()
     # if model provided, attempt prediction
     if args.model:
         model_path = Path(args.model)
         if not model_path.exists():
+            write_features()
             result_obj['model_error'] = f'model not found: {model_path}'
             print(json.dumps(result_obj))
             sys.exit(0)
         try:
-            model = joblib.load(str(model_path))
+            with prof.stage('model_load'):
+                model = joblib.load(str(model_path))
         except Exception as e:
+            write_features()
             result_obj['model_error'] = f'failed to load model: {e}'
             print(json.dumps(result_obj))
             sys.exit(0)
 
+        alerts_path = Path(args.alerts_output) if args.alerts_output else out_path.with_name(out_path.stem + '_alerts.jsonl')
         try:
-            Xp = align_features_with_model(X.copy(), model)
-            preds = None
-            confidences = None
-            # use predict_proba if available
-            if hasattr(model, 'predict_proba'):
-                probs = model.predict_proba(Xp)
-                # choose class with max prob and max prob as confidence
-                idx = np.argmax(probs, axis=1)
-                preds = model.classes_[idx] if hasattr(model, 'classes_') else model.predict(Xp)
-                confidences = probs[np.arange(len(idx)), idx]
-            else:
-                preds = model.predict(Xp)
-                # no proba: confidence based on trees (if forest has predict_proba through wrapper)
-                confidences = np.full(len(preds), 0.0)
-
-            # attach to CSV
-            out_df = X.copy()
-            out_df['predicted_class'] = preds
-            out_df['confidence'] = confidences
-            out_df.to_csv(out_path, index=False)
-
-            result_obj['predictions'] = str(out_path)
-            result_obj['pred_count'] = int(len(out_df))
+            predict_and_write(conn_df, X, model, model_path, out_path, alerts_path, args, prof, result_obj)
         except Exception as e:
+            if 'predictions' not in result_obj:
+                write_features()
             result_obj['model_error'] = f'prediction_failed: {e}'
 
+    if args.profile:
+        try:
+            result_obj['profile_report'] = prof.write_report(out_path.with_name(out_path.stem + '.profile.txt'))
+        except Exception as e:
+            result_obj['profile_error'] = f'failed to write profile report: {e}'
+
     print(json.dumps(result_obj))
     sys.exit(0)
 
@@ -0,0 +1,55 @@
+"""Batch-mode input expansion and per-log output naming (scorer.py --zeek_conn with globs/directories)"""
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from scorer import batch_output_names, expand_conn_inputs
+
+
+def _touch(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text('#fields\tts\n', encoding='utf-8')
+    return path
+
+
+def test_glob_over_zeek_directories_finds_their_conn_logs(tmp_path):
+    logs = [_touch(tmp_path / 'results' / f'zeek_{i}' / 'conn.log') for i in (1, 2)]
+    _touch(tmp_path / 'results' / 'zeek_2' / 'dns.log')
+    _touch(tmp_path / 'results' / 'other' / 'conn.log')
+
+    paths, is_batch = expand_conn_inputs([str(tmp_path / 'results' / 'zeek_*')])
+
+    assert is_batch
+    assert [p.resolve() for p in paths] == [p.resolve() for p in logs]
+
+
+def test_glob_matching_files_and_plain_directory(tmp_path):
+    a = _touch(tmp_path / 'a' / 'conn.00.log')
+    b = _touch(tmp_path / 'b' / 'nested' / 'conn.log')
+
+    paths, is_batch = expand_conn_inputs([str(tmp_path / 'a' / 'conn*.log'), str(tmp_path / 'b')])
+
+    assert is_batch
+    assert [p.resolve() for p in paths] == [a.resolve(), b.resolve()]
+
+
+def test_single_plain_path_is_not_batch(tmp_path):
+    log = _touch(tmp_path / 'conn.log')
+    assert expand_conn_inputs([str(log)]) == ([log], False)
+
+
+def test_output_names_keep_parent_directory(tmp_path):
+    logs = [_touch(tmp_path / 'results' / f'zeek_{i}' / 'conn.log') for i in (1, 2)]
+    assert batch_output_names(logs) == ['zeek_1__conn', 'zeek_2__conn']
+
+
+def test_output_names_do_not_collide_on_repeated_directory_names(tmp_path):
+    logs = [_touch(tmp_path / side / 'zeek_1' / 'conn.log') for side in ('a', 'b')]
+    names = batch_output_names(logs)
+    assert names == ['a__zeek_1__conn', 'b__zeek_1__conn']
+
+
+def test_output_names_for_logs_in_one_directory(tmp_path):
+    logs = [_touch(tmp_path / 'zeek_1' / f'conn.{i}.log') for i in ('00', '01')]
+    assert batch_output_names(logs) == ['zeek_1__conn.00', 'zeek_1__conn.01']
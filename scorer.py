@@ -1,17 +1,36 @@
 # score_zeek_batch.py
 import argparse
+import gzip
 import json
+import re
 import time
-from collections import deque, defaultdict
+import heapq
+from collections import Counter, OrderedDict, deque
+from itertools import count as _seq
+from itertools import islice
 import joblib
 import numpy as np
 import pandas as pd
 import os
 import sys
+import warnings
+from scipy import sparse
+
+# optional fast JSON decoder; falls back to the stdlib
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    orjson = None
+    _json_loads = json.loads
 
 # ---------- CONFIG ----------
 WINDOW_SECONDS = 2.0    # window used to compute count/srv_count/same_srv_rate (match your training)
 ALERT_PROB_THRESHOLD = 0.6  # tune based on validation
+ALERT_TOP_K = 10000         # max alerts written to the alert stream (0 = unlimited)
+ALERT_PER_CLASS_CAP = 2000  # max alerts per predicted class (0 = unlimited)
+ALERT_DEDUP_KEYS = ['id_orig_h', 'id_resp_h', 'service']  # collapse repeats of the same flow tuple
+ALERT_PRINT_LIMIT = 20      # alerts echoed to stdout
 # numeric features you listed (ensure matches your training numeric_features)
 NUMERIC_FEATURES = [
     'duration','src_bytes','dst_bytes','wrong_fragment','urgent','hot',
@@ -26,6 +45,13 @@ NUMERIC_FEATURES = [
     'dst_host_srv_rerror_rate'
 ]
 CATEGORICAL_BASE = ['protocol_type', 'service', 'flag']  # we'll one-hot these from observed values
+# Zeek conn.log fields actually consumed by zeek_batch_to_frame (parser projects to these)
+ZEEK_CONN_FIELDS = ['ts', 'id.orig_h', 'id.resp_h', 'proto', 'service', 'duration',
+                    'orig_bytes', 'resp_bytes', 'conn_state']
+PARSE_BATCH_SIZE = 50000     # records per columnar batch
+READ_CHUNK_SIZE = 1 << 20    # bytes per read for the incremental JSON array decoder
+MAX_TRACKED_HOSTS = 100000   # hard cap on per-source windows kept by RollingAggregator (LRU beyond this)
+AGG_STATE_VERSION = 1        # on-disk RollingAggregator snapshot format (--state_dir)
 # ----------------------------
 
 def load_model(model_path):
@@ -43,107 +69,291 @@ def read_train_columns(path):
         cols = [l.strip() for l in f if l.strip()]
     return cols
 
+def _iter_json_array(f, chunk_size=READ_CHUNK_SIZE):
+    """
+    Incrementally decode a top-level JSON array of objects from file object f,
+    reading chunk_size characters at a time instead of loading the whole file.
+    Malformed elements raise json.JSONDecodeError, like json.load would.
+    """
+    decoder = json.JSONDecoder()
+    failed = None   # (message, offset into the object) of the last failed decode
+    buf = f.read(chunk_size)
+    pos = buf.find('[') + 1
+    if pos == 0:
+        return
+    while True:
+        # skip separators, refilling the buffer as needed
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buf):
+                break
+            more = f.read(chunk_size)
+            if not more:
+                return
+            buf, pos = more, 0
+        if buf[pos] == ']':
+            return
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            # an object cut off by the chunk boundary decodes (or fails further
+            # on) once more input is appended; failing again at the same spot
+            # means the element itself is malformed. An unterminated string
+            # may simply be longer than a chunk, so keep reading for those.
+            error = (e.msg, e.pos - pos)
+            if error == failed and not e.msg.startswith('Unterminated string'):
+                raise
+            more = f.read(chunk_size)
+            if not more:
+                raise
+            failed = error
+            buf, pos = buf[pos:] + more, 0
+            continue
+        failed = None
+        yield obj
+        pos = end
+        if pos >= chunk_size:
+            buf, pos = buf[pos:], 0
+
+def _decode_jsonl_line(line):
+    """Decode one JSONL line; tolerates leading/trailing text around the {...} object"""
+    try:
+        return _json_loads(line)
+    except ValueError:
+        start = line.find('{')
+        end = line.rfind('}')
+        if start != -1 and end != -1:
+            try:
+                return _json_loads(line[start:end+1])
+            except ValueError:
+                return None
+        return None
+
+def _iter_jsonl_batches(f, batch_size):
+    """Yield lists of decoded records, decoding each batch of lines in one call when possible"""
+    while True:
+        lines = [ln.strip() for ln in islice(f, batch_size)]
+        if not lines:
+            return
+        lines = [ln for ln in lines if ln]
+        if not lines:
+            continue
+        try:
+            # fast path: the whole batch as one JSON array
+            recs = _json_loads('[' + ','.join(lines) + ']')
+        except ValueError:
+            recs = [_decode_jsonl_line(ln) for ln in lines]
+        yield [r for r in recs if isinstance(r, dict)]
+
+def _iter_zeek_json_records(f, batch_size):
+    """Yield lists of raw record dicts from a JSONL or JSON-array Zeek log"""
+    first = f.read(2)
+    f.seek(0)
+    if first.lstrip().startswith('['):
+        batch = []
+        for rec in _iter_json_array(f):
+            if isinstance(rec, dict):
+                batch.append(rec)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    else:
+        yield from _iter_jsonl_batches(f, batch_size)
+
+def iter_zeek_json_batches(path, batch_size=PARSE_BATCH_SIZE, fields=ZEEK_CONN_FIELDS):
+    """
+    Stream a Zeek conn.log produced with the JSON writer (JSONL or '[]' array)
+    as columnar batches: dicts mapping each projected field to a list of values
+    (None where a record lacks the field). Memory is bounded by batch_size.
+    """
+    with open(path, 'r', errors='ignore') as f:
+        for recs in _iter_zeek_json_records(f, batch_size):
+            if recs:
+                yield {fld: [r.get(fld) for r in recs] for fld in fields}
+
 def parse_zeek_json_lines(path):
     """
     Reads a Zeek conn.log produced with JSON writer.
     It accepts either JSONL (one json per line) or a file that has a '[]' JSON array.
-    Yields parsed dicts.
+    Yields parsed dicts (all fields; see iter_zeek_json_batches for the columnar path).
     """
     with open(path, 'r', errors='ignore') as f:
-        first = f.read(2)
-        f.seek(0)
-        # attempt JSONL
-        if first.startswith('['):
-            # array of JSON objects
-            data = json.load(f)
-            for rec in data:
-                yield rec
-        else:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                # some Zeek JSON lines have leading/trailing text; try to parse robustly
-                try:
-                    rec = json.loads(line)
-                    yield rec
-                except json.JSONDecodeError:
-                    # try extracting first {...} chunk
-                    start = line.find('{')
-                    end = line.rfind('}')
-                    if start != -1 and end != -1:
-                        try:
-                            rec = json.loads(line[start:end+1])
-                            yield rec
-                        except Exception:
-                            continue
-                    else:
-                        continue
-
-def zeek_to_base_row(rec):
-    """Map Zeek conn.log fields to base row values (raw columns prior to OHE)"""
-    # default safe conversions (use 0 / 'unknown' when missing)
-    def safe_float(x, default=0.0):
-        try:
-            return float(x)
-        except Exception:
-            return default
-    def safe_int(x, default=0):
-        try:
-            return int(float(x))
-        except Exception:
-            return default
-
-    row = {}
-    row['duration'] = safe_float(rec.get('duration', 0.0))
-    row['src_bytes'] = safe_int(rec.get('orig_bytes', 0))
-    row['dst_bytes'] = safe_int(rec.get('resp_bytes', 0))
-    # fields that may not exist in Zeek conn.log: default to 0
-    for nf in ['wrong_fragment','urgent','hot','num_failed_logins','num_compromised',
-               'root_shell','su_attempted','num_root','num_file_creations','num_shells',
-               'num_access_files','num_outbound_cmds',
-               'serror_rate','srv_serror_rate','rerror_rate','srv_rerror_rate',
-               'diff_srv_rate','srv_diff_host_rate',
-               'dst_host_count','dst_host_srv_count','dst_host_same_srv_rate',
-               'dst_host_diff_srv_rate','dst_host_same_src_port_rate',
-               'dst_host_srv_diff_host_rate','dst_host_serror_rate',
-               'dst_host_srv_serror_rate','dst_host_rerror_rate','dst_host_srv_rerror_rate']:
-        row[nf] = 0.0
-
-    # categoricals
-    row['protocol_type'] = rec.get('proto', 'unknown')
-    # Zeek service can be '-' or many; default to 'unknown'
-    svc = rec.get('service')
-    if not svc or svc == '-':
-        svc = 'unknown'
-    row['service'] = svc
-    # map conn_state -> flag (KDD flags are different but we keep raw conn_state)
-    row['flag'] = rec.get('conn_state', 'OTH')
-
-    # for aggregations
-    row['_ts'] = safe_float(rec.get('ts', time.time()))
-    row['_id_orig_h'] = rec.get('id.orig_h', None)
-    row['_id_resp_h'] = rec.get('id.resp_h', None)
-
-    return row
+        for recs in _iter_zeek_json_records(f, PARSE_BATCH_SIZE):
+            yield from recs
+
+def _numeric_column(values, default=0.0):
+    """Vectorized equivalent of safe_float over a list of raw values"""
+    col = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce')
+    return col.replace([np.inf, -np.inf], np.nan).fillna(default).astype(float)
+
+def zeek_batch_to_frame(batch):
+    """
+    Map one batch from iter_zeek_json_batches to a DataFrame of base columns
+    (prior to OHE): duration as float, bytes truncated to ints (missing -> 0),
+    service '-'/missing -> 'unknown', conn_state kept as the flag, ts and
+    hosts for aggregation.
+    Unlisted NUMERIC_FEATURES are left out and zero-filled by build_feature_dataframe.
+    """
+    n = len(batch['ts'])
+    svc = pd.Series(batch['service'], dtype=object)
+    svc = svc.where(svc.notna() & (svc != '-') & (svc != ''), 'unknown')
+    ts = pd.to_numeric(pd.Series(batch['ts'], dtype=object), errors='coerce')
+    return pd.DataFrame({
+        'duration': _numeric_column(batch['duration']),
+        'src_bytes': np.trunc(_numeric_column(batch['orig_bytes'])).astype(np.int64),
+        'dst_bytes': np.trunc(_numeric_column(batch['resp_bytes'])).astype(np.int64),
+        'protocol_type': pd.Series(batch['proto'], dtype=object).fillna('unknown'),
+        'service': svc,
+        'flag': pd.Series(batch['conn_state'], dtype=object).fillna('OTH'),
+        '_ts': ts.fillna(time.time()).astype(float),
+        '_id_orig_h': pd.Series(batch['id.orig_h'], dtype=object),
+        '_id_resp_h': pd.Series(batch['id.resp_h'], dtype=object),
+    }, index=pd.RangeIndex(n))
+
+class _HostWindow:
+    """Entries of one source host inside the window plus running service/dest counts"""
+    __slots__ = ('entries', 'services', 'dests', 'newest')
+
+    def __init__(self):
+        self.entries = deque()
+        self.services = Counter()
+        self.dests = Counter()
+        self.newest = float('-inf')
+
+    def append(self, ts, service, dest_host):
+        self.entries.append((ts, service, dest_host))
+        self.services[service] += 1
+        if dest_host:
+            self.dests[dest_host] += 1
+
+    def popleft(self):
+        _, service, dest_host = self.entries.popleft()
+        self.services[service] -= 1
+        if not self.services[service]:
+            del self.services[service]
+        if dest_host:
+            self.dests[dest_host] -= 1
+            if not self.dests[dest_host]:
+                del self.dests[dest_host]
 
 # Rolling aggregator for per-source computations (count, srv_count, same_srv_rate)
 class RollingAggregator:
-    def __init__(self, window_seconds=WINDOW_SECONDS):
+    """
+    Per-source sliding windows with bounded state. Hosts whose newest entry
+    is older than (latest ts seen - window) are evicted through a min-heap
+    keyed by that newest ts; beyond max_hosts the least recently updated host
+    is dropped. Evictions are counted in evicted_idle / evicted_lru.
+    """
+    def __init__(self, window_seconds=WINDOW_SECONDS, max_hosts=MAX_TRACKED_HOSTS):
         self.window = window_seconds
-        self.per_host = defaultdict(lambda: deque())
+        self.max_hosts = max_hosts
+        self.per_host = OrderedDict()   # host -> _HostWindow, least recently updated first
+        self._expiry = []               # heap of (newest ts, seq, host); stale items skipped on pop
+        self._seq = _seq()
+        self.watermark = float('-inf')  # latest ts seen
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+
+    def _expire_idle(self):
+        cutoff = self.watermark - self.window
+        while self._expiry and self._expiry[0][0] < cutoff:
+            newest, _, host = heapq.heappop(self._expiry)
+            hw = self.per_host.get(host)
+            if hw is not None and hw.newest == newest:
+                del self.per_host[host]
+                self.evicted_idle += 1
+
+    def stats(self):
+        return {'tracked_hosts': len(self.per_host), 'evicted_idle': self.evicted_idle,
+                'evicted_lru': self.evicted_lru}
+
+    def snapshot(self):
+        """
+        Compact, JSON-serializable copy of the state: only entries still inside
+        the window (ts >= watermark - window), with hosts, services and dests
+        stored once in string tables and entries as parallel index/ts lists.
+        Hosts keep their least-recently-updated-first order.
+        """
+        cutoff = self.watermark - self.window
+        hosts, services, dests = [], {}, {}
+        e_host, e_ts, e_svc, e_dst = [], [], [], []
+        for host, hw in self.per_host.items():
+            kept = [e for e in hw.entries if e[0] >= cutoff]
+            if not kept:
+                continue
+            h = len(hosts)
+            hosts.append(host)
+            for ts, service, dest_host in kept:
+                e_host.append(h)
+                e_ts.append(ts)
+                e_svc.append(services.setdefault(service, len(services)))
+                e_dst.append(dests.setdefault(dest_host, len(dests)) if dest_host else -1)
+        return {
+            'version': AGG_STATE_VERSION,
+            'window': self.window,
+            'watermark': self.watermark if hosts else None,
+            'hosts': hosts,
+            'services': list(services),
+            'dests': list(dests),
+            'entries': {'host': e_host, 'ts': e_ts, 'service': e_svc, 'dest': e_dst},
+        }
+
+    @classmethod
+    def from_snapshot(cls, snap, window_seconds=WINDOW_SECONDS, max_hosts=MAX_TRACKED_HOSTS):
+        """Rebuild an aggregator from snapshot(); entries outside the current window are pruned on next use"""
+        if snap.get('version') != AGG_STATE_VERSION:
+            raise ValueError(f"unsupported aggregator state version: {snap.get('version')}")
+        agg = cls(window_seconds=window_seconds, max_hosts=max_hosts)
+        hosts, services, dests = snap['hosts'], snap['services'], snap['dests']
+        e = snap['entries']
+        for h, ts, sv, d in zip(e['host'], e['ts'], e['service'], e['dest']):
+            host = hosts[h]
+            hw = agg.per_host.get(host)
+            if hw is None:
+                hw = agg.per_host[host] = _HostWindow()
+            hw.append(ts, services[sv], dests[d] if d >= 0 else None)
+            if ts > hw.newest:
+                hw.newest = ts
+        for host, hw in agg.per_host.items():
+            heapq.heappush(agg._expiry, (hw.newest, next(agg._seq), host))
+        while len(agg.per_host) > agg.max_hosts:
+            agg.per_host.popitem(last=False)
+        if snap.get('watermark') is not None:
+            agg.watermark = snap['watermark']
+        return agg
 
     def add_and_compute(self, src_host, ts, service, dest_host):
-        dq = self.per_host[src_host]
-        dq.append((ts, service, dest_host))
+        if ts > self.watermark:
+            self.watermark = ts
+            self._expire_idle()
+        hw = self.per_host.get(src_host)
+        if hw is None:
+            hw = self.per_host[src_host] = _HostWindow()
+            if len(self.per_host) > self.max_hosts:
+                self.per_host.popitem(last=False)
+                self.evicted_lru += 1
+                if len(self._expiry) > 2 * self.max_hosts:
+                    # LRU-evicted hosts leave stale heap items behind until
+                    # their ts expires; rebuild so a burst inside one window stays bounded
+                    self._expiry = [(h.newest, next(self._seq), host) for host, h in self.per_host.items()]
+                    heapq.heapify(self._expiry)
+        else:
+            self.per_host.move_to_end(src_host)
+        hw.append(ts, service, dest_host)
+        if ts > hw.newest:
+            hw.newest = ts
+            heapq.heappush(self._expiry, (ts, next(self._seq), src_host))
         # remove old
-        while dq and (ts - dq[0][0]) > self.window:
-            dq.popleft()
-        total = len(dq)
-        srv_count = sum(1 for t,s,d in dq if s == service)
+        while hw.entries and (ts - hw.entries[0][0]) > self.window:
+            hw.popleft()
+        total = len(hw.entries)
+        srv_count = hw.services[service]
         same_srv_rate = srv_count / total if total > 0 else 0.0
         # dst_host_count = number of unique dest hosts in window
-        dst_unique = len(set(d for _,_,d in dq if d))
+        dst_unique = len(hw.dests)
         # other aggregated features can be computed similarly (placeholders used in training)
         return {
             'count': total,
@@ -162,48 +372,123 @@ class RollingAggregator:
             'dst_host_srv_rerror_rate': 0.0
         }
 
-def build_feature_dataframe(rows, observed_cat_values=None):
+def agg_state_path(state_dir, sensor):
+    """Snapshot file for one sensor inside state_dir"""
+    safe = re.sub(r'[^A-Za-z0-9_.-]', '_', sensor or 'default')
+    return os.path.join(state_dir, f"aggstate_{safe}.json.gz")
+
+def load_aggregator_state(path, window_seconds=WINDOW_SECONDS, max_hosts=MAX_TRACKED_HOSTS):
+    """Restore a RollingAggregator from a gzip JSON snapshot; returns a fresh one if the file is missing"""
+    if not os.path.exists(path):
+        return RollingAggregator(window_seconds=window_seconds, max_hosts=max_hosts)
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        snap = json.load(f)
+    return RollingAggregator.from_snapshot(snap, window_seconds=window_seconds, max_hosts=max_hosts)
+
+def save_aggregator_state(agg, path):
+    """Write agg.snapshot() as gzip JSON (atomically, via a temp file)"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+        json.dump(agg.snapshot(), f, separators=(',', ':'))
+    os.replace(tmp, path)
+
+def build_onehot_csr(df, observed_cat_values=None):
     """
-    rows: list of base rows (dicts) containing numeric + categorical raw values
-    observed_cat_values: dict mapping categorical -> set(values) optionally from training
+    One-hot encode CATEGORICAL_BASE into a single CSR matrix in one pass per
+    categorical: each column is stringified once and mapped to integer codes,
+    which (plus the categorical's column offset) become the CSR column indices.
+    Values not in observed_cat_values get an all-zero block.
+    Returns (csr uint8 matrix, column names like 'service__http').
     """
-    df = pd.DataFrame(rows)
-    # remove helper columns from df (we keep ts and hosts separately if needed)
-    df_ts = df.get('_ts')
-    df_src = df.get('_id_orig_h')
-    df_dest = df.get('_id_resp_h')
-
-    # Keep only the NUMERIC_FEATURES present; missing numeric fields will be filled later
-    # But first handle categorical OHE for protocol_type, service, flag
-    # Use observed_cat_values if provided to create consistent columns; otherwise use observed in data
+    n = len(df)
     ohe_cols = []
-    for cat in ['protocol_type','service','flag']:
-        values = None
+    code_blocks = []
+    offset = 0
+    for cat in CATEGORICAL_BASE:
+        strs = df[cat].astype(str)
         if observed_cat_values and cat in observed_cat_values:
-            values = list(observed_cat_values[cat])
+            values = [str(v) for v in observed_cat_values[cat]]
+            codes = pd.Categorical(strs, categories=values).codes.astype(np.int64)
         else:
-            # use unique values in this batch
-            values = sorted(df[cat].astype(str).unique().tolist())
-        # create columns like protocol_type_tcp, service_http, flag_SF
-        for v in values:
-            col = f"{cat}__{v}"
-            df[col] = (df[cat].astype(str) == str(v)).astype(int)
-            ohe_cols.append(col)
-
-    # Ensure all NUMERIC_FEATURES columns exist (fill missing with 0)
-    for num in NUMERIC_FEATURES:
-        if num not in df.columns:
-            df[num] = 0.0
-
-    # drop helper columns (but keep underlying numeric ones)
+            # use unique values in this batch (sorted, as before)
+            codes, uniques = pd.factorize(strs, sort=True)
+            values = list(uniques)
+        ohe_cols.extend(f"{cat}__{v}" for v in values)
+        code_blocks.append(np.where(codes >= 0, codes + offset, -1))
+        offset += len(values)
+    if not code_blocks:
+        return sparse.csr_matrix((n, 0), dtype=np.uint8), ohe_cols
+    # (n_rows, n_categoricals) column indices; drop unseen (-1) entries
+    idx = np.column_stack(code_blocks)
+    present = idx >= 0
+    indptr = np.concatenate([[0], np.cumsum(present.sum(axis=1))])
+    indices = idx[present]
+    data = np.ones(len(indices), dtype=np.uint8)
+    return sparse.csr_matrix((data, indices, indptr), shape=(n, offset)), ohe_cols
+
+def build_feature_dataframe(rows, observed_cat_values=None):
+    """
+    rows: list of base rows (dicts) or a DataFrame containing numeric + categorical raw values
+    observed_cat_values: dict mapping categorical -> set(values) optionally from training
+    Returns NUMERIC_FEATURES (dense) followed by one-hot columns stored as pandas sparse columns.
+    """
+    df = pd.DataFrame(rows)
+
+    # Numeric block built in one go; missing NUMERIC_FEATURES are 0, inf/nan replaced by 0
+    num_df = df.reindex(columns=NUMERIC_FEATURES, fill_value=0.0)
+    num_df = num_df.replace([np.inf, -np.inf], 0).fillna(0)
+
+    # Categorical OHE for protocol_type, service, flag as one CSR block
+    csr, ohe_cols = build_onehot_csr(df, observed_cat_values)
+    ohe_df = pd.DataFrame.sparse.from_spmatrix(csr, index=num_df.index, columns=ohe_cols)
+
     # Keep ordering: numeric features first, then ohe cols (this order can be adjusted)
-    final_cols = NUMERIC_FEATURES + ohe_cols
-    final_df = df[final_cols].copy()
+    return pd.concat([num_df, ohe_df], axis=1)
 
-    # replace inf/nan
-    final_df = final_df.replace([np.inf, -np.inf], 0).fillna(0)
+def to_model_matrix(df, dense=False):
+    """
+    Model input for an aligned feature frame: a float32 CSR matrix (dense
+    columns are mostly zero-filled counters, so this stays small) or, when
+    dense=True, a dense float32 array.
+    """
+    if dense:
+        return df.to_numpy(dtype=np.float32)
+    return df.astype(pd.SparseDtype(np.float32, 0)).sparse.to_coo().tocsr()
 
-    return final_df
+def predict_with_model(model, aligned_df):
+    """
+    Predict from the aligned frame, preferring sparse input and densifying
+    to float32 only if the model rejects it; a model that needs the
+    DataFrame itself (e.g. a column-name based Pipeline) gets it last.
+    Only TypeError/ValueError (how estimators reject an input type) move
+    on to the next input kind, and each fallback is reported; any other
+    error propagates. Returns (preds, max_probs, input_kind).
+    """
+    attempts = [('sparse', lambda: to_model_matrix(aligned_df)),
+                ('dense_float32', lambda: to_model_matrix(aligned_df, dense=True)),
+                ('dataframe', lambda: aligned_df)]
+    last_err = None
+    for kind, make_input in attempts:
+        try:
+            X = make_input()
+            with warnings.catch_warnings():
+                # arrays carry no column names; alignment already fixed the order
+                warnings.filterwarnings('ignore', message='X does not have valid feature names')
+                if hasattr(model, 'predict_proba'):
+                    probs = model.predict_proba(X)
+                    # multiclass: probs shape (n_samples, n_classes)
+                    # choose predicted class and confidence
+                    preds = model.predict(X)
+                    max_probs = probs.max(axis=1)
+                else:
+                    preds = model.predict(X)
+                    max_probs = np.ones(len(preds))
+            return preds, max_probs, kind
+        except (TypeError, ValueError) as e:
+            print(f"[!] Model rejected {kind} input ({type(e).__name__}: {e})")
+            last_err = e
+    raise last_err
 
 def align_with_model_columns(df, model, train_cols_path=None):
     """
@@ -218,10 +503,7 @@ def align_with_model_columns(df, model, train_cols_path=None):
         with open(train_cols_path, 'r') as f:
             train_cols = [l.strip() for l in f if l.strip()]
         # add any missing train_cols to df with 0 values
-        for c in train_cols:
-            if c not in df.columns:
-                df[c] = 0
-        aligned = df[train_cols].copy()
+        aligned = df.reindex(columns=train_cols, fill_value=0)
         return aligned, f"Aligned using train_columns file ({train_cols_path}), missing cols filled with 0"
     # Try model.feature_names_in_
     feat_names = None
@@ -232,10 +514,7 @@ def align_with_model_columns(df, model, train_cols_path=None):
         feat_names = None
 
     if feat_names:
-        for c in feat_names:
-            if c not in df.columns:
-                df[c] = 0
-        aligned = df[feat_names].copy()
+        aligned = df.reindex(columns=feat_names, fill_value=0)
         return aligned, "Aligned using model.feature_names_in_"
     # Last resort: try to use intersection (drop extra columns)
     common = [c for c in df.columns if c in getattr(model, 'coef_', {}) or c in getattr(model, 'feature_importances_', {}) or True]
@@ -243,6 +522,30 @@ def align_with_model_columns(df, model, train_cols_path=None):
     # We do safe fallback: keep df columns, add no new ones
     return df.copy(), "No train columns or model.feature_names_in_; using available columns (may mismatch model expectation)"
 
+def extract_alerts(out, top_k=ALERT_TOP_K, per_class=ALERT_PER_CLASS_CAP, dedup=True):
+    """
+    Vectorized alert selection over the scored output.
+    Keeps rows with pred_class != 0 OR pred_confidence >= ALERT_PROB_THRESHOLD, ordered by
+    confidence; with dedup, keeps the most confident row per ALERT_DEDUP_KEYS and records how
+    many rows it stands for in 'hits'. Then applies the per-class cap and the overall top-K.
+    Returns (alerts_df, n_matching_rows).
+    """
+    mask = (out['pred_class'] != 0) | (out['pred_confidence'] >= ALERT_PROB_THRESHOLD)
+    alerts = out.loc[mask, ['ts', 'id_orig_h', 'id_resp_h', 'service', 'protocol_type', 'flag',
+                            'pred_class', 'pred_confidence']]
+    n_matching = int(len(alerts))
+    alerts = alerts.sort_values('pred_confidence', ascending=False, kind='stable')
+    if dedup:
+        hits = alerts.groupby(ALERT_DEDUP_KEYS, dropna=False, sort=False)['pred_confidence'].transform('size')
+        alerts = alerts.assign(hits=hits).drop_duplicates(ALERT_DEDUP_KEYS, keep='first')
+    else:
+        alerts = alerts.assign(hits=1)
+    if per_class:
+        alerts = alerts[alerts.groupby('pred_class', sort=False).cumcount() < per_class]
+    if top_k:
+        alerts = alerts.head(top_k)
+    return alerts.reset_index(drop=True), n_matching
+
 def main(args):
     # Load model
     model = load_model(args.model)
@@ -252,28 +555,39 @@ def main(args):
 
     # If user provided observed categorical values file (optional), load it - not implemented here; we rely on batch values
 
-    # Read zeek conn log
+    # Read zeek conn log as columnar batches and compute rolling features
     print("[*] Parsing Zeek conn log...")
-    parsed = list(parse_zeek_json_lines(args.zeek_conn))
-    if not parsed:
+    # Restore the previous run's window for this sensor so counts continue across captures
+    state_path = agg_state_path(args.state_dir, args.sensor) if args.state_dir else None
+    if state_path:
+        try:
+            agg = load_aggregator_state(state_path)
+            if agg.per_host:
+                print(f"[*] Restored aggregator state from {state_path} ({len(agg.per_host)} hosts)")
+        except Exception as e:
+            print(f"[!] Could not restore aggregator state from {state_path}: {e}; starting empty")
+            agg = RollingAggregator(window_seconds=WINDOW_SECONDS)
+    else:
+        agg = RollingAggregator(window_seconds=WINDOW_SECONDS)
+    frames = []
+    for batch in iter_zeek_json_batches(args.zeek_conn):
+        base = zeek_batch_to_frame(batch)
+        # compute aggregates per source host (falls back to dest host when source is missing)
+        srcs = base['_id_orig_h'].where(base['_id_orig_h'].notna() & (base['_id_orig_h'] != ''), base['_id_resp_h'])
+        srcs = srcs.where(srcs.notna() & (srcs != ''), 'unknown_host')
+        aggs = [agg.add_and_compute(src, ts, svc, dst)
+                for src, ts, svc, dst in zip(srcs, base['_ts'], base['service'], base['_id_resp_h'])]
+        frames.append(pd.concat([base, pd.DataFrame(aggs, index=base.index)], axis=1))
+    if not frames:
         print("[!] No records parsed from Zeek conn log. Exiting.")
         return
-
-    # Convert Zeek records to base rows and compute rolling features
-    agg = RollingAggregator(window_seconds=WINDOW_SECONDS)
-    rows = []
-    for rec in parsed:
-        base = zeek_to_base_row(rec)
-        # compute aggregates for this source host
-        src = base.get('_id_orig_h') or base.get('_id_resp_h') or 'unknown_host'
-        ts = base.get('_ts', time.time())
-        svc = base.get('service', 'unknown')
-        dst = base.get('_id_resp_h')
-        a = agg.add_and_compute(src, ts, svc, dst)
-        # update base with aggregated ones
-        for k,v in a.items():
-            base[k] = v
-        rows.append(base)
+    rows = pd.concat(frames, ignore_index=True)
+    st = agg.stats()
+    print(f"[*] Rolling aggregator: {st['tracked_hosts']} hosts tracked, "
+          f"{st['evicted_idle']} evicted idle, {st['evicted_lru']} evicted by cap")
+    if state_path:
+        save_aggregator_state(agg, state_path)
+        print(f"[*] Saved aggregator state to {state_path}")
 
     # Build DataFrame of features (one-hot for observed categories)
     print("[*] Building feature DataFrame (numeric + one-hot)...")
@@ -286,16 +600,10 @@ def main(args):
     # If columns mismatch model input size badly, warn user
     # Attempt prediction
     try:
-        # if model pipeline was saved and expects raw features, it will handle preprocessing internally
-        if hasattr(model, 'predict_proba'):
-            probs = model.predict_proba(aligned_df)
-            # multiclass: probs shape (n_samples, n_classes)
-            # choose predicted class and confidence
-            preds = model.predict(aligned_df)
-            max_probs = probs.max(axis=1)
-        else:
-            preds = model.predict(aligned_df)
-            max_probs = np.ones(len(preds))
+        # sparse CSR first; dense float32 / the DataFrame only if the model needs it
+        # (a saved pipeline that expects raw features handles preprocessing internally)
+        preds, max_probs, input_kind = predict_with_model(model, aligned_df)
+        print("[*] Model input:", input_kind)
     except Exception as e:
         print("[!] Model prediction failed:", e)
         print(" - possible causes: column mismatch or model expects different preprocessing (one-hot / scaling).")
@@ -313,18 +621,15 @@ def main(args):
     out['pred_class'] = preds
     out['pred_confidence'] = max_probs
     # attach some original metadata for triage if present
-    # we still have original parsed list order; add id/dest/ts columns if available in rows
-    meta = []
-    for r in rows:
-        meta.append({
-            'ts': r.get('_ts'),
-            'id_orig_h': r.get('_id_orig_h'),
-            'id_resp_h': r.get('_id_resp_h'),
-            'service': r.get('service'),
-            'protocol_type': r.get('protocol_type'),
-            'flag': r.get('flag')
-        })
-    meta_df = pd.DataFrame(meta)
+    # rows keeps the original parsed order; add id/dest/ts columns for triage
+    meta_df = pd.DataFrame({
+        'ts': rows['_ts'],
+        'id_orig_h': rows['_id_orig_h'],
+        'id_resp_h': rows['_id_resp_h'],
+        'service': rows['service'],
+        'protocol_type': rows['protocol_type'],
+        'flag': rows['flag']
+    })
     out = pd.concat([meta_df.reset_index(drop=True), out.reset_index(drop=True)], axis=1)
 
     # Save CSV
@@ -332,15 +637,25 @@ def main(args):
     out.to_csv(out_fname, index=False)
     print(f"[*] Wrote scored output to {out_fname}")
 
-    # Print alerts for probable attacks
-    print("\n[*] Alerts (predicted attack classes != 0 OR confidence > threshold):")
+    # Alerts for probable attacks: vectorized selection, written as a JSONL stream
     # assume class 0 = Normal, 1..4 = attack categories as you trained
-    alerts = out[(out['pred_class'] != 0) | (out['pred_confidence'] >= ALERT_PROB_THRESHOLD)]
+    alerts, n_matching = extract_alerts(out, top_k=args.alerts_top_k, per_class=args.alerts_per_class,
+                                        dedup=not args.no_alert_dedup)
+    alerts_fname = args.alerts_output or (os.path.splitext(out_fname)[0] + '_alerts.jsonl')
+    alerts.to_json(alerts_fname, orient='records', lines=True)
+    print(f"\n[*] Alerts (predicted attack classes != 0 OR confidence > threshold): "
+          f"{n_matching} matching rows, {len(alerts)} written to {alerts_fname}")
     if alerts.empty:
         print("No alerts found with current threshold/settings.")
     else:
-        for idx, row in alerts.iterrows():
-            print(f"ALERT: ts={row.get('ts')}, src={row.get('id_orig_h')}, dst={row.get('id_resp_h')}, svc={row.get('service')}, proto={row.get('protocol_type')}, pred_class={row.get('pred_class')}, conf={row.get('pred_confidence'):.3f}")
+        head = alerts.head(ALERT_PRINT_LIMIT)
+        lines = ("ALERT: ts=" + head['ts'].astype(str) + ", src=" + head['id_orig_h'].astype(str)
+                 + ", dst=" + head['id_resp_h'].astype(str) + ", svc=" + head['service'].astype(str)
+                 + ", proto=" + head['protocol_type'].astype(str) + ", pred_class=" + head['pred_class'].astype(str)
+                 + ", conf=" + head['pred_confidence'].map('{:.3f}'.format) + ", hits=" + head['hits'].astype(str))
+        print("\n".join(lines))
+        if len(alerts) > len(head):
+            print(f"... {len(alerts) - len(head)} more in {alerts_fname}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Score Zeek conn.log JSON against a saved RF model.")
@@ -348,5 +663,11 @@ if __name__ == "__main__":
     parser.add_argument('--model', required=True, help="Path to saved joblib model (e.g., network_anomaly_detection_model.joblib).")
     parser.add_argument('--train_cols', required=False, default=None, help="Optional path to newline-separated train column names file (raw columns before OHE).")
     parser.add_argument('--output', required=False, default='scored_conn.csv', help="Output CSV filename.")
+    parser.add_argument('--state_dir', required=False, default=None, help="Directory for rolling-window snapshots; restores before and saves after scoring.")
+    parser.add_argument('--sensor', required=False, default='default', help="Sensor name keying the snapshot in --state_dir.")
+    parser.add_argument('--alerts_output', required=False, default=None, help="Alert stream JSONL filename (default: <output>_alerts.jsonl).")
+    parser.add_argument('--alerts_top_k', type=int, default=ALERT_TOP_K, help="Max alerts written, highest confidence first (0 = unlimited).")
+    parser.add_argument('--alerts_per_class', type=int, default=ALERT_PER_CLASS_CAP, help="Max alerts per predicted class (0 = unlimited).")
+    parser.add_argument('--no_alert_dedup', action='store_true', help="Do not collapse alerts sharing (src, dst, service).")
     args = parser.parse_args()
     main(args)